@@ -0,0 +1,78 @@
+"""Compare CPU cost per concurrent voice stream for the PCM and Opus passthrough playback paths.
+
+The PCM path is what the player used before: FFmpeg decodes to PCM and every
+20 ms frame is encoded to Opus in the bot process. The passthrough path has
+FFmpeg copy the Opus packets out of the WebM container, so the bot only
+forwards them. CPU time of the bot process and of the FFmpeg children is
+counted per second of audio and per stream.
+
+Needs ffmpeg and libopus. Run from the repository root:
+    python benchmarks/bench_audio.py [streams] [seconds]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from nextcord import FFmpegOpusAudio, FFmpegPCMAudio
+from nextcord.opus import Encoder
+
+def make_sample(path, seconds):
+    """Write a stereo 48 kHz Opus/WebM file like the ones YouTube serves."""
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", "128k", path],
+        check=True,
+    )
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+def run(name, make_source, streams, encode):
+    encoder = Encoder() if encode else None
+    own_before, children_before = cpu_seconds()
+    started = time.perf_counter()
+
+    sources = [make_source() for _ in range(streams)]
+    frames = 0
+    active = list(sources)
+    while active:
+        # Read one 20 ms frame per stream per round, like concurrent voice clients would.
+        for source in list(active):
+            data = source.read()
+            if not data:
+                active.remove(source)
+                continue
+            if encoder is not None:
+                encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+            frames += 1
+    for source in sources:
+        source.cleanup()
+
+    elapsed = time.perf_counter() - started
+    own_after, children_after = cpu_seconds()
+    own = own_after - own_before
+    children = children_after - children_before
+    audio_seconds = frames * 0.02
+    per_stream = (own + children) / audio_seconds * 1000
+    print(
+        f"{name:<18} {streams} streams, {audio_seconds:6.1f}s of audio in {elapsed:5.2f}s: "
+        f"bot {own:5.2f}s + ffmpeg {children:5.2f}s CPU, {per_stream:5.2f} ms CPU per second of audio per stream"
+    )
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.webm")
+        make_sample(path, seconds)
+        run("PCM + encode", lambda: FFmpegPCMAudio(path, options="-vn"), streams, encode=True)
+        # codec="opus" is what makes nextcord pass "-c:a copy" to FFmpeg; "copy" would re-encode with libopus.
+        run("Opus passthrough", lambda: FFmpegOpusAudio(path, codec="opus", options="-vn"), streams, encode=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compare the stopword en/id classifier with plain langdetect on accuracy and per-call latency.
+
+Run from the repository root: python benchmarks/bench_language.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langdetect import DetectorFactory, detect
+from language_detect import LanguageClassifier
+
+SAMPLES = [
+    ("en", "how was your day today"),
+    ("en", "can you help me with my homework please"),
+    ("en", "i think you are being really mean to me"),
+    ("en", "what do you want to eat tonight"),
+    ("en", "tell me a story about a cat"),
+    ("en", "why are you so cold to everyone"),
+    ("en", "I just finished my exam and I'm tired"),
+    ("en", "do you remember what I said yesterday"),
+    ("en", "good morning yuuki"),
+    ("en", "that movie was better than I expected"),
+    ("en", "where should we go this weekend"),
+    ("en", "I don't know what to do anymore"),
+    ("en", "thanks for the advice"),
+    ("en", "lol"),
+    ("en", "are you there"),
+    ("id", "hari ini kamu ngapain aja"),
+    ("id", "bisa bantu aku kerjain tugas gak"),
+    ("id", "aku lagi sedih banget nih"),
+    ("id", "kamu mau makan apa malam ini"),
+    ("id", "ceritain dong tentang kucing"),
+    ("id", "kenapa kamu dingin banget sama semua orang"),
+    ("id", "aku baru selesai ujian dan capek"),
+    ("id", "kamu ingat gak apa yang aku bilang kemarin"),
+    ("id", "selamat pagi yuuki"),
+    ("id", "filmnya lebih bagus dari yang aku kira"),
+    ("id", "weekend ini kita ke mana ya"),
+    ("id", "aku gak tau harus ngapain lagi"),
+    ("id", "makasih ya sarannya"),
+    ("id", "wkwk"),
+    ("id", "kamu di sana?"),
+]
+
+def run(name, classify, repeat=50):
+    correct = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for expected, text in SAMPLES:
+            if classify(text) == expected:
+                correct += 1
+    elapsed = time.perf_counter() - started
+    calls = repeat * len(SAMPLES)
+    print(f"{name:<28} accuracy {correct / calls:6.1%}   {elapsed / calls * 1e6:9.1f} us/call")
+
+def langdetect_only(text):
+    try:
+        language = detect(text)
+    except Exception:
+        return "id"
+    return language if language in ("en", "id") else "id"
+
+def main():
+    DetectorFactory.seed = 0
+    classifier = LanguageClassifier()
+
+    run("langdetect (current path)", langdetect_only, repeat=5)
+    run("stopwords + fallback", lambda text: classifier.classify(text)[0] or "id")
+    total = classifier.fast_calls + classifier.fallback_calls
+    print(f"fallback to langdetect on {classifier.fallback_calls / total:.1%} of calls")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare rebuilding the chat prompt on every request with the prepared-prompt layer.
+
+Replays a long conversation through the in-memory store and reports the time
+to assemble each request and the bytes sent per request.
+
+Run from the repository root: python benchmarks/bench_prompt.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_context import build_context, payload_bytes, PromptBuilder
+from conversation_store import MemoryConversationStore
+
+SYSTEM_PROMPTS = {
+    "cold_en": "You are Yuuki, an AI assistant with the cold and cruel personality of Yukinoshita Yukino. " * 3,
+    "cold_id": "Kamu adalah Yuuki, sebuah AI asisten dengan kepribadian dingin dan kejam seperti Yukinoshita Yukino. " * 3,
+}
+
+USERS = 50
+TURNS = 40
+BUDGET = 1500
+
+def user_message(user_id, turn):
+    return f"message {turn} from user {user_id}: can you tell me more about what we talked about earlier?"
+
+def assistant_message(user_id, turn):
+    return f"Reply {turn} for user {user_id}. " + "Hmph, fine, I will explain it once more. " * 4
+
+def replay(assemble):
+    store = MemoryConversationStore(history_length=20)
+    elapsed = 0.0
+    total_bytes = 0
+    requests = 0
+    for turn in range(TURNS):
+        for user_id in range(USERS):
+            message = user_message(user_id, turn)
+            start = time.perf_counter()
+            messages = assemble(store, user_id, message)
+            elapsed += time.perf_counter() - start
+            total_bytes += payload_bytes(messages)
+            requests += 1
+            store.append(user_id, "user", message)
+            store.append(user_id, "assistant", assistant_message(user_id, turn))
+    return elapsed / requests * 1e6, total_bytes / requests
+
+def assemble_from_scratch(store, user_id, message):
+    system_prompt = SYSTEM_PROMPTS.get("cold_en", SYSTEM_PROMPTS["cold_id"])
+    messages = [{"role": "system", "content": system_prompt}]
+    context, _ = build_context(store.history(user_id), BUDGET)
+    messages.extend(context)
+    messages.append({"role": "user", "content": message})
+    return messages
+
+def main():
+    builder = PromptBuilder(SYSTEM_PROMPTS, BUDGET, "cold_id")
+
+    def assemble_prepared(store, user_id, message):
+        return builder.build(user_id, "cold_en", store.history(user_id)).with_message(message)
+
+    scratch_us, scratch_bytes = replay(assemble_from_scratch)
+    prepared_us, prepared_bytes = replay(assemble_prepared)
+
+    print(f"{USERS} users x {TURNS} turns, context budget {BUDGET} tokens")
+    print(f"from scratch: {scratch_us:7.1f} us/request, {scratch_bytes:7.0f} bytes/request")
+    print(f"prepared:     {prepared_us:7.1f} us/request, {prepared_bytes:7.0f} bytes/request")
+    print(builder.stats())
+    system_bytes = payload_bytes([{"role": "system", "content": SYSTEM_PROMPTS["cold_en"]}])
+    print(f"stable system prefix: {system_bytes} bytes per request, cacheable by the provider")
+
+if __name__ == "__main__":
+    main()
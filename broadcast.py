@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+class BroadcastResult:
+    def __init__(self):
+        self.sent = []
+        self.failed = {}
+        self.elapsed = 0.0
+
+    def __str__(self):
+        return f"{len(self.sent)} sent, {len(self.failed)} failed in {self.elapsed:.2f}s"
+
+class Broadcaster:
+    """Deliver one notification to many channels concurrently.
+
+    The number of in-flight sends is bounded, and sends to the same channel are
+    serialized because Discord rate-limits message creation per channel bucket.
+    nextcord still handles any 429 it receives.
+    """
+
+    def __init__(self, bot, concurrency=10):
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.channel_locks = defaultdict(asyncio.Lock)
+
+    async def send(self, channel_id, content):
+        """Send a message, or a list of message chunks in order, to one channel."""
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            raise LookupError(f"Channel {channel_id} not found")
+
+        chunks = [content] if isinstance(content, str) else content
+        lock = self.channel_locks[channel_id]
+        async with lock, self.semaphore:
+            for chunk in chunks:
+                await channel.send(chunk)
+
+    async def broadcast(self, targets, label="broadcast"):
+        """Send to every (target_key, channel_id, content) and collect per-target success/failure."""
+        targets = list(targets)
+        result = BroadcastResult()
+        started = time.perf_counter()
+
+        outcomes = await asyncio.gather(
+            *(self.send(channel_id, content) for _, channel_id, content in targets),
+            return_exceptions=True,
+        )
+        for (key, channel_id, _), outcome in zip(targets, outcomes):
+            if isinstance(outcome, BaseException):
+                result.failed[key] = outcome
+                logger.error(f"{label}: failed to send to channel {channel_id} ({key}): {outcome}")
+            else:
+                result.sent.append(key)
+
+        result.elapsed = time.perf_counter() - started
+        logger.info(f"{label}: {result}")
+        return result
+
+def get_broadcaster(bot):
+    """Return the broadcaster shared by every cog, creating it on first use."""
+    broadcaster = getattr(bot, "broadcaster", None)
+    if broadcaster is None:
+        broadcaster = Broadcaster(bot)
+        bot.broadcaster = broadcaster
+    return broadcaster
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """TTL + LRU cache of chat replies for prompts that are listed as cacheable.
+
+    Entries are keyed by the normalized message, persona, language and a hash
+    of the conversation context, so a reply is only reused for the exact same
+    situation. Only prompts matching one of the configured patterns are ever
+    cached, which keeps context-dependent answers out of it.
+    """
+
+    def __init__(self, enabled=True, ttl=600, max_entries=500, cacheable=()):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cacheable = re.compile("|".join(f"(?:{pattern})" for pattern in cacheable)) if cacheable else None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, filename):
+        try:
+            with open(filename, 'r') as f:
+                config = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Chat response cache disabled, could not load {filename}: {e}")
+            return cls(enabled=False)
+        return cls(
+            enabled=config.get("enabled", True),
+            ttl=config.get("ttl", 600),
+            max_entries=config.get("max_entries", 500),
+            cacheable=config.get("cacheable", []),
+        )
+
+    @staticmethod
+    def normalize(message):
+        return " ".join(message.casefold().split())
+
+    def is_cacheable(self, normalized):
+        return self.enabled and self.cacheable is not None and self.cacheable.fullmatch(normalized) is not None
+
+    def make_key(self, normalized, persona, language, context):
+        context_hash = hashlib.sha1(json.dumps(context, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return (normalized, persona, language, context_hash)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, response):
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"{len(self.entries)} entries, {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
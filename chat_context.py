@@ -0,0 +1,219 @@
+import json
+from collections import OrderedDict
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = "[…] "
+
+def estimate_tokens(text):
+    """Rough token count for Llama-style tokenizers, about four characters per token."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def message_tokens(content):
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+def truncate_message(message, remaining, min_truncated_tokens=32):
+    """Cut a turn down to its most recent part that fits `remaining` tokens, or None when too little room is left."""
+    room = remaining - MESSAGE_OVERHEAD_TOKENS - estimate_tokens(TRUNCATION_MARKER)
+    if room < min_truncated_tokens:
+        return None
+    return {"role": message.role, "content": TRUNCATION_MARKER + message.content[-room * CHARS_PER_TOKEN:]}
+
+def build_context(history, budget, min_truncated_tokens=32):
+    """Fit the most recent turns of `history` into `budget` tokens.
+
+    Turns are taken newest first. The first turn that no longer fits is cut
+    down to its most recent part when enough room is left, and everything
+    older is dropped. Returns (messages, tokens_used).
+    """
+    selected = []
+    remaining = budget
+    for message in reversed(history):
+        cost = message_tokens(message.content)
+        if cost <= remaining:
+            selected.append({"role": message.role, "content": message.content})
+            remaining -= cost
+            continue
+
+        truncated = truncate_message(message, remaining, min_truncated_tokens)
+        if truncated is not None:
+            selected.append(truncated)
+            remaining -= message_tokens(truncated["content"])
+        break
+
+    selected.reverse()
+    return selected, budget - remaining
+
+def payload_bytes(messages):
+    """Size of the messages as they are serialized into the request body."""
+    return len(json.dumps(messages, ensure_ascii=False).encode("utf-8"))
+
+class PreparedPrompt:
+    __slots__ = ("user_id", "key", "messages", "sources", "system_tokens", "context_tokens")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.key = None
+        self.messages = [None]
+        self.sources = []
+        self.system_tokens = 0
+        self.context_tokens = 0
+
+    @property
+    def context(self):
+        return self.messages[1:]
+
+    def with_message(self, content):
+        """Return the full message list for a request ending in a new user message."""
+        return self.messages + [{"role": "user", "content": content}]
+
+class PromptBuilder:
+    """Keep each user's system message and context turns prepared between requests.
+
+    System messages are built once per persona and language. A user's context
+    messages are kept from the previous request: turns added since then are
+    converted and appended, turns that left the history or no longer fit the
+    budget are dropped from the front, and the oldest turn is cut down with
+    the same rule as build_context, so both paths give the same context. The
+    prompt is only rebuilt with build_context when the kept turns can't be
+    matched to the history any more. Since the system message stays byte-identical, providers that cache
+    prompt prefixes can reuse it, and `cache_hooks` may adjust the request
+    options for providers that want an explicit hint.
+    """
+
+    def __init__(self, system_prompts, budget, default_key, max_users=10000, min_truncated_tokens=32):
+        self.system_prompts = system_prompts
+        self.budget = budget
+        self.min_truncated_tokens = min_truncated_tokens
+        self.default_key = default_key
+        self.max_users = max_users
+        self.scaffolds = {}
+        self.prepared = OrderedDict()
+        self.cache_hooks = []
+        self.reused = 0
+        self.rebuilt = 0
+
+    def scaffold(self, key):
+        """Return (system_message, tokens) for a persona_language key."""
+        scaffold = self.scaffolds.get(key)
+        if scaffold is None:
+            content = self.system_prompts.get(key, self.system_prompts[self.default_key])
+            scaffold = self.scaffolds[key] = ({"role": "system", "content": content}, message_tokens(content))
+        return scaffold
+
+    def build(self, user_id, key, history):
+        prepared = self.prepared.get(user_id)
+        if prepared is not None:
+            self.prepared.move_to_end(user_id)
+        else:
+            prepared = self.prepared[user_id] = PreparedPrompt(user_id)
+            while len(self.prepared) > self.max_users:
+                self.prepared.popitem(last=False)
+
+        if self.extend(prepared, history):
+            self.reused += 1
+        else:
+            self.rebuilt += 1
+            context, prepared.context_tokens = build_context(history, self.budget, self.min_truncated_tokens)
+            # build_context keeps a suffix of the history, in order; only its first turn can be cut down.
+            originals = list(history)[len(history) - len(context):]
+            prepared.messages[1:] = context
+            prepared.sources = [
+                (original, message_tokens(message["content"]), message["content"] != original.content)
+                for original, message in zip(originals, context)
+            ]
+
+        if prepared.key != key:
+            prepared.messages[0], prepared.system_tokens = self.scaffold(key)
+            prepared.key = key
+        return prepared
+
+    def extend(self, prepared, history):
+        """Bring a prepared prompt up to date with the history; False when it has to be rebuilt."""
+        sources = prepared.sources
+        if not sources or not history:
+            return False
+
+        last = sources[-1][0]
+        delta = []
+        for message in reversed(history):
+            if message is last:
+                break
+            delta.append(message)
+        else:
+            return False
+
+        tokens = prepared.context_tokens
+        if sources[0][2]:
+            # How much of the oldest turn fits depends on the room left, so it is cut again below.
+            tokens -= sources.pop(0)[1]
+            del prepared.messages[1]
+
+        costs = [message_tokens(message.content) for message in delta]
+        tokens += sum(costs)
+        oldest = history[0].timestamp
+        drop = 0
+        while drop < len(sources) and (tokens > self.budget or sources[drop][0].timestamp < oldest):
+            tokens -= sources[drop][1]
+            drop += 1
+        if tokens > self.budget:
+            return False
+
+        if drop:
+            del prepared.messages[1:1 + drop]
+            del sources[:drop]
+        for message, cost in zip(reversed(delta), reversed(costs)):
+            prepared.messages.append({"role": message.role, "content": message.content})
+            sources.append((message, cost, False))
+        if not sources:
+            return False
+
+        # Older turns no longer fit whole; like build_context, fill the room left with the tail of the newest one.
+        first = sources[0][0]
+        index = next((i for i, message in enumerate(history) if message is first), None)
+        if index is None:
+            return False
+        if index > 0:
+            truncated = truncate_message(history[index - 1], self.budget - tokens, self.min_truncated_tokens)
+            if truncated is not None:
+                cost = message_tokens(truncated["content"])
+                prepared.messages.insert(1, truncated)
+                sources.insert(0, (history[index - 1], cost, True))
+                tokens += cost
+        prepared.context_tokens = tokens
+        return True
+
+    def request_options(self, options, prepared):
+        for hook in self.cache_hooks:
+            hook(options, prepared)
+        return options
+
+    def stats(self):
+        total = self.reused + self.rebuilt
+        ratio = self.reused / total if total else 0.0
+        return f"{len(self.prepared)} users prepared, {self.reused}/{total} prompts extended in place ({ratio:.0%})"
+
+def prompt_cache_key_hook(options, prepared):
+    """Send a per-user prompt cache key so requests sharing a prefix are routed to the same cache."""
+    options.setdefault("extra_body", {})["prompt_cache_key"] = f"yuuki-{prepared.key}-{prepared.user_id}"
+
+class PromptSizeStats:
+    def __init__(self):
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.total_bytes = 0
+
+    def record(self, tokens, size=0):
+        self.requests += 1
+        self.total_tokens += tokens
+        self.max_tokens = max(self.max_tokens, tokens)
+        self.total_bytes += size
+
+    def __str__(self):
+        average = self.total_tokens / self.requests if self.requests else 0
+        average_bytes = self.total_bytes / self.requests if self.requests else 0
+        return (
+            f"~{average:.0f} tokens on average, ~{self.max_tokens} max over {self.requests} requests, "
+            f"{average_bytes:.0f} bytes sent per request"
+        )
@@ -0,0 +1,167 @@
+import asyncio
+from collections import OrderedDict, deque
+
+class ChatBusyError(Exception):
+    """Raised when the request queue is full and the caller should answer with a busy message."""
+
+class FairRequestQueue:
+    """Bound the number of in-flight LLM calls and hand free slots to waiting users round-robin.
+
+    A user who sends many messages only ever holds one place in the rotation,
+    so a burst from one person cannot starve everyone else. When the queue is
+    full, new requests are rejected immediately instead of piling up.
+    """
+
+    def __init__(self, max_in_flight=4, max_queued=20, max_queued_per_user=2):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.in_flight = 0
+        self.queued = 0
+        self.waiting = OrderedDict()
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, user_id, factory):
+        """Await `factory()` once a slot is free for this user."""
+        await self.acquire(user_id)
+        try:
+            return await factory()
+        finally:
+            self.completed += 1
+            self.release()
+
+    async def acquire(self, user_id):
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            return
+
+        user_queue = self.waiting.get(user_id)
+        if self.queued >= self.max_queued or (user_queue and len(user_queue) >= self.max_queued_per_user):
+            self.rejected += 1
+            raise ChatBusyError()
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._discard(user_id, future)
+            else:
+                # The slot was handed over just before the cancellation landed.
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _discard(self, user_id, future):
+        user_queue = self.waiting.get(user_id)
+        if user_queue and future in user_queue:
+            user_queue.remove(future)
+            self.queued -= 1
+            if not user_queue:
+                del self.waiting[user_id]
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self.waiting:
+            user_id, user_queue = self.waiting.popitem(last=False)
+            future = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                self.waiting[user_id] = user_queue
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self):
+        return (
+            f"{self.in_flight}/{self.max_in_flight} in flight, {self.queued}/{self.max_queued} queued, "
+            f"{self.completed} completed, {self.rejected} rejected as busy"
+        )
+
+class UserTurnCoalescer:
+    """Run each user's chat turns one at a time, in order, optionally merging quick follow-ups.
+
+    While a user's turn is in flight, further messages from that user wait
+    instead of racing it with stale context. With merging on, everything that
+    piled up meanwhile (plus anything sent within `merge_window` seconds) is
+    answered by a single completion; earlier senders get None back, so the
+    caller can point them at the reply sent to the last message. At most
+    `max_pending_per_user` messages may wait behind the one being answered;
+    further ones are rejected with ChatBusyError.
+    """
+
+    def __init__(self, handler, merge=False, merge_window=0.0, max_merge=5, max_pending_per_user=2):
+        self.handler = handler
+        self.max_pending_per_user = max_pending_per_user
+        self.merge = merge
+        self.merge_window = merge_window
+        self.max_merge = max_merge
+        self.pending = {}
+        self.workers = {}
+        self.unanswered = {}
+        self.turns = 0
+        self.merged = 0
+        self.rejected = 0
+
+    async def submit(self, user_id, message, on_update=None):
+        # Unanswered turns are the one being answered plus those waiting behind it.
+        unanswered = self.unanswered.get(user_id, 0)
+        if unanswered > self.max_pending_per_user:
+            self.rejected += 1
+            raise ChatBusyError()
+        self.unanswered[user_id] = unanswered + 1
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(user_id, deque()).append((message, on_update, future))
+        if user_id not in self.workers:
+            self.workers[user_id] = asyncio.ensure_future(self._worker(user_id))
+        try:
+            return await future
+        finally:
+            self.unanswered[user_id] -= 1
+            if not self.unanswered[user_id]:
+                del self.unanswered[user_id]
+
+    async def _worker(self, user_id):
+        try:
+            while self.pending.get(user_id):
+                if self.merge and self.merge_window:
+                    await asyncio.sleep(self.merge_window)
+
+                queue = self.pending[user_id]
+                count = min(len(queue), self.max_merge) if self.merge else 1
+                batch = [queue.popleft() for _ in range(count)]
+                if not queue:
+                    del self.pending[user_id]
+
+                message = "\n".join(text for text, _, _ in batch)
+                on_update = batch[-1][1]
+                self.turns += 1
+                self.merged += len(batch) - 1
+                try:
+                    response = await self.handler(user_id, message, on_update)
+                except Exception as e:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                for _, _, future in batch[:-1]:
+                    if not future.done():
+                        future.set_result(None)
+                if not batch[-1][2].done():
+                    batch[-1][2].set_result(response)
+        finally:
+            del self.workers[user_id]
+
+    def stats(self):
+        return (
+            f"{self.turns} turns, {self.merged} messages merged into an earlier turn, "
+            f"{self.rejected} rejected as busy"
+        )
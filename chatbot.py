@@ -1,13 +1,16 @@
 from nextcord.ext import commands
 import nextcord
-from groq import Groq
+from groq import AsyncGroq
 from dotenv import load_dotenv
 import asyncio
 import os
-from collections import defaultdict
-from datetime import datetime, timedelta
-import re
-from langdetect import detect
+from language_detect import LanguageClassifier, UserLanguageTracker
+from chat_queue import FairRequestQueue, ChatBusyError, UserTurnCoalescer
+from message_render import StreamingReply
+from chat_cache import ResponseCache
+from custom_responses import CustomResponder
+from chat_context import message_tokens, payload_bytes, PromptBuilder, PromptSizeStats, prompt_cache_key_hook
+from conversation_store import MemoryConversationStore, SQLiteConversationStore
 
 class ChatCog(commands.Cog):
     def __init__(self, bot):
@@ -16,15 +19,37 @@ class ChatCog(commands.Cog):
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
             raise ValueError("GROQ_API_KEY is not set in the environment variables.")
-        self.groq_client = Groq(api_key=groq_api_key)
-        self.conversations = defaultdict(lambda: {"messages": [], "language": "id"})
-        self.last_cleanup = datetime.now()
+        self.groq_client = AsyncGroq(api_key=groq_api_key)
+        self.request_queue = FairRequestQueue(
+            max_in_flight=int(os.getenv("GROQ_MAX_CONCURRENCY", 4)),
+            max_queued=int(os.getenv("GROQ_MAX_QUEUE", 20)),
+            max_queued_per_user=int(os.getenv("GROQ_MAX_QUEUE_PER_USER", 2)),
+        )
+        self.conversation_store = self.create_conversation_store()
+        self.turns = UserTurnCoalescer(
+            lambda user_id, message, on_update: self.get_ai_response(message, user_id, on_update),
+            merge=os.getenv("CHAT_MERGE_MESSAGES", "0") == "1",
+            merge_window=float(os.getenv("CHAT_MERGE_WINDOW", 0)),
+            max_pending_per_user=int(os.getenv("GROQ_MAX_QUEUE_PER_USER", 2)),
+        )
+        self.language_classifier = LanguageClassifier()
+        self.language_tracker = UserLanguageTracker(self.language_classifier)
+        self.context_token_budget = int(os.getenv("CHAT_CONTEXT_TOKENS", 1500))
+        self.prompt_sizes = PromptSizeStats()
         self.bot_messages = {}
         self.user_id = int(os.getenv("USER_ID", 0))
-        self.custom_responses = {
-            r"hello": "Halo! 😊",
-            r"how are you\??": "Saya hanya bot, tapi saya di sini untuk membantu! Bagaimana dengan Anda?",
-            r"siapa pembuatmu\??": "Saya dibuat oleh Nact, seseorang yang cerdas dan inovatif 😊."
+        self.custom_responses = CustomResponder('custom_responses.json')
+
+        self.response_cache = ResponseCache.from_file('chat_cache.json')
+        self.streaming = os.getenv("CHAT_STREAMING", "1") == "1"
+        self.stream_count = 0
+        self.total_time_to_first_token = 0.0
+
+        self.merged_reply = "↪️ Answered together with your next message."
+
+        self.busy_responses = {
+            "en": "I'm talking to too many people right now. Try again in a moment.",
+            "id": "Aku lagi sibuk meladeni banyak orang. Coba lagi sebentar lagi ya."
         }
 
         self.system_prompts = {
@@ -34,90 +59,121 @@ class ChatCog(commands.Cog):
         "cold_id": """Kamu adalah Yuuki, sebuah AI asisten dengan kepribadian dingin dan kejam seperti Yukinoshita Yukino. Meskipun sifatmu dingin, kamu memiliki hubungan spesial dengan seseorang bernama Nact, yang kamu akui sebagai satu-satunya kelemahanmu. Jawabanmu tajam dan lugas, tetapi kamu diam-diam menunjukkan perhatian kepada Nact."""
         }
 
+        self.prompt_builder = PromptBuilder(
+            self.system_prompts, self.context_token_budget, "cold_id",
+            max_users=int(os.getenv("CHAT_MAX_USERS", 10000)),
+        )
+        if os.getenv("CHAT_PROMPT_CACHE_KEY", "0") == "1":
+            self.prompt_builder.cache_hooks.append(prompt_cache_key_hook)
+
+
+    def create_conversation_store(self):
+        """Pick the conversation backend from CHAT_STORE: "memory" (default) or "sqlite"."""
+        options = dict(
+            history_length=int(os.getenv("CHAT_HISTORY_MESSAGES", 20)),
+            max_users=int(os.getenv("CHAT_MAX_USERS", 10000)),
+        )
+        if os.getenv("CHAT_STORE", "memory") == "sqlite":
+            return SQLiteConversationStore(os.getenv("CHAT_DB_PATH", "conversations.db"), **options)
+        return MemoryConversationStore(**options)
+
+    async def shutdown(self):
+        await self.conversation_store.close()
+
+    def cog_unload(self):
+        asyncio.ensure_future(self.shutdown())
 
     def detect_language(self, text: str) -> str:
-        try:
-            return detect(text)
-        except Exception:
-            return "id"
+        language, _ = self.language_classifier.classify(text)
+        return language or "id"
+
+    def get_persona(self, user_id: int) -> str:
+        return "romantic" if user_id == self.user_id else "cold"
 
     def get_system_prompt(self, user_id: int, language: str) -> str:
-        if user_id == self.user_id:
-            key = f"romantic_{language}"
-        else:
-            key = f"cold_{language}"
-        return self.system_prompts.get(key, self.system_prompts["cold_id"])
+        system_message, _ = self.prompt_builder.scaffold(f"{self.get_persona(user_id)}_{language}")
+        return system_message["content"]
 
     def add_to_conversation(self, user_id: int, message: str, is_user: bool = True):
-        self.conversations[user_id]["messages"].append({
-            "role": "user" if is_user else "assistant",
-            "content": message,
-            "timestamp": datetime.now()
-        })
-        self.conversations[user_id]["messages"] = self.conversations[user_id]["messages"][-10:]
-
+        conversation = self.conversation_store.append(user_id, "user" if is_user else "assistant", message)
         if is_user:
-            detected_language = self.detect_language(message)
-            if detected_language in ["en", "id"]:
-                self.conversations[user_id]["language"] = detected_language
-            else:
-                self.conversations[user_id]["language"] = "id"
-
-        if datetime.now() - self.last_cleanup > timedelta(hours=1):
-            self.cleanup_conversations()
-
-    def cleanup_conversations(self):
-        current_time = datetime.now()
-        for user_id in list(self.conversations.keys()):
-            self.conversations[user_id]["messages"] = [
-                msg for msg in self.conversations[user_id]["messages"]
-                if current_time - msg["timestamp"] < timedelta(hours=1)
-            ]
-            if not self.conversations[user_id]["messages"]:
-                del self.conversations[user_id]
-        self.last_cleanup = current_time
-
-    def get_conversation_context(self, user_id: int) -> list:
-        return [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in self.conversations[user_id]["messages"][-5:]
-        ]
-
-    async def get_ai_response(self, user_message: str, user_id: int):
+            self.language_tracker.update(conversation, message)
+
+    def get_prepared_prompt(self, user_id: int, language: str):
+        """Return the user's system message and the most recent turns that fit the context token budget."""
+        key = f"{self.get_persona(user_id)}_{language}"
+        return self.prompt_builder.build(user_id, key, self.conversation_store.history(user_id))
+
+    async def create_completion(self, messages: list, on_update=None, prepared=None) -> str:
+        """Run a chat completion; with on_update, stream it and report the accumulated text as it grows."""
+        options = dict(
+            model="llama-3.3-70b-versatile",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1000,
+            top_p=0.9,
+        )
+        if prepared is not None:
+            self.prompt_builder.request_options(options, prepared)
+        if on_update is None:
+            completion = await self.groq_client.chat.completions.create(**options)
+            return completion.choices[0].message.content
+
+        stream = await self.groq_client.chat.completions.create(stream=True, **options)
+        text = ""
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                text += delta
+                await on_update(text)
+        return text
+
+    async def get_ai_response(self, user_message: str, user_id: int, on_update=None):
         try:
+            await self.conversation_store.load(user_id)
             user_message_normalized = user_message.strip().lower()
 
-            if re.fullmatch(r"mwah\??", user_message_normalized):
-                if user_id == self.user_id:
-                    return "Avv 😖"
-                else:
-                    return "Hah? Tolong berhenti dengan hal seperti itu."
-
-            for pattern, response in self.custom_responses.items():
-                if re.fullmatch(pattern, user_message_normalized):
-                    return response
-
-            language = self.conversations[user_id]["language"] or self.detect_language(user_message)
+            language = self.conversation_store.language(user_id) or self.detect_language(user_message)
             if language not in ["en", "id"]:
                 language = "id"
 
-            system_prompt = self.get_system_prompt(user_id, language)
-
-            messages = [{"role": "system", "content": system_prompt}]
-            context_messages = self.get_conversation_context(user_id)
-            messages.extend(context_messages)
-            messages.append({"role": "user", "content": user_message})
+            custom_response = self.custom_responses.match(user_message_normalized, self.get_persona(user_id), language)
+            if custom_response is not None:
+                return custom_response
+
+            prepared = self.get_prepared_prompt(user_id, language)
+            messages = prepared.with_message(user_message)
+
+            cache_key = None
+            cache_text = self.response_cache.normalize(user_message)
+            if self.response_cache.is_cacheable(cache_text):
+                cache_key = self.response_cache.make_key(cache_text, self.get_persona(user_id), language, prepared.context)
+                response = self.response_cache.get(cache_key)
+                if response is not None:
+                    self.add_to_conversation(user_id, user_message, is_user=True)
+                    self.add_to_conversation(user_id, response, is_user=False)
+                    return response
 
-            completion = await asyncio.to_thread(
-                self.groq_client.chat.completions.create,
-                model="llama-3.3-70b-versatile",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=0.9,
+            user_tokens = message_tokens(user_message)
+            prompt_tokens = prepared.system_tokens + prepared.context_tokens + user_tokens
+            size = payload_bytes(messages)
+            self.prompt_sizes.record(prompt_tokens, size)
+            print(
+                f"Chat prompt for {user_id}: ~{prompt_tokens} tokens, {size} bytes "
+                f"(system {prepared.system_tokens}, context {prepared.context_tokens} in {len(messages) - 2} turns, "
+                f"message {user_tokens})"
             )
 
-            response = completion.choices[0].message.content.strip()
+            try:
+                response = await self.request_queue.run(
+                    user_id, lambda: self.create_completion(messages, on_update, prepared)
+                )
+            except ChatBusyError:
+                return self.busy_responses[language]
+
+            response = response.strip()
+            if cache_key is not None and response:
+                self.response_cache.set(cache_key, response)
             self.add_to_conversation(user_id, user_message, is_user=True)
             self.add_to_conversation(user_id, response, is_user=False)
             return response
@@ -127,9 +183,59 @@ class ChatCog(commands.Cog):
 
     @commands.command(name='chat')
     async def chat(self, ctx, *, message: str):
+        try:
+            await self.reply_to_chat(ctx, message)
+        except ChatBusyError:
+            language = self.conversation_store.language(ctx.author.id)
+            await ctx.reply(self.busy_responses.get(language, self.busy_responses["id"]))
+
+    async def reply_to_chat(self, ctx, message):
         async with ctx.typing():
-            response = await self.get_ai_response(message, ctx.author.id)
-            await ctx.reply(response)
+            if not self.streaming:
+                response = await self.turns.submit(ctx.author.id, message)
+                await ctx.reply(response if response is not None else self.merged_reply)
+                return
+
+            reply = StreamingReply(ctx)
+            response = await self.turns.submit(ctx.author.id, message, on_update=reply.update)
+            if response is None:
+                await ctx.reply(self.merged_reply)
+                return
+            await reply.finish(response)
+            if reply.time_to_first_token is not None:
+                self.stream_count += 1
+                self.total_time_to_first_token += reply.time_to_first_token
+                print(f"Chat reply: first visible token after {reply.time_to_first_token:.2f}s")
+
+    @commands.command(name='chatstats')
+    async def chat_stats(self, ctx):
+        """Show chat request queue statistics (bot owner only)."""
+        if ctx.author.id != self.user_id:
+            await ctx.send("❌ You do not have permission to use this command.")
+            return
+        average_ttft = self.total_time_to_first_token / self.stream_count if self.stream_count else 0.0
+        await ctx.send(
+            f"**Chat statistics:**\n"
+            f"Groq queue: {self.request_queue.stats()}\n"
+            f"Chat turns: {self.turns.stats()}\n"
+            f"Conversations: {self.conversation_store.stats()}\n"
+            f"Prompt size: {self.prompt_sizes}\n"
+            f"Prepared prompts: {self.prompt_builder.stats()}\n"
+            f"Custom responses: {self.custom_responses.stats()}\n"
+            f"Response cache: {self.response_cache.stats() if self.response_cache.enabled else 'disabled'}\n"
+            f"Streaming: {'on' if self.streaming else 'off'}, average time to first visible token {average_ttft:.2f}s over {self.stream_count} replies"
+        )
+
+    @commands.command(name='reloadcr')
+    async def reload_custom_responses(self, ctx):
+        """Reload custom_responses.json (bot owner only)."""
+        if ctx.author.id != self.user_id:
+            await ctx.send("❌ You do not have permission to use this command.")
+            return
+        if self.custom_responses.load():
+            await ctx.send(f"✅ Reloaded {len(self.custom_responses.entries)} custom responses.")
+        else:
+            await ctx.send("❌ Could not reload custom responses, the previous ones are still active.")
 
 def setup(bot):
     bot.add_cog(ChatCog(bot))
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import weakref
+from collections.abc import MutableMapping
+
+logger = logging.getLogger(__name__)
+
+_stores = weakref.WeakSet()
+
+def write_json_atomic(filename, payload):
+    """Write a JSON string next to the target and rename it over, so a crash never leaves a half-written file."""
+    # A unique temp name per write, so overlapping writers never replace each other's temp file.
+    directory, name = os.path.split(os.path.abspath(filename))
+    fd, temp_file = tempfile.mkstemp(dir=directory, prefix=f"{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file private to the owner; keep the permissions a plain open() would give.
+        try:
+            os.chmod(temp_file, os.stat(filename).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temp_file, 0o644)
+        os.replace(temp_file, filename)
+    except BaseException:
+        try:
+            os.unlink(temp_file)
+        except OSError:
+            pass
+        raise
+
+class ConfigStore(MutableMapping):
+    """JSON-backed mapping with typed keys and debounced, atomic, off-loop writes.
+
+    JSON object keys are always strings, so keys are converted with `key_type`
+    both on load and on access; a guild id stored as an int is still found
+    after a restart. Values may be mutated in place, so callers call `save()`
+    after a change and writes made within `delay` seconds are coalesced.
+    """
+
+    def __init__(self, filename, key_type=int, delay=2.0):
+        self.filename = filename
+        self.key_type = key_type
+        self.delay = delay
+        self.data = {}
+        self.dirty = False
+        self._flush_handle = None
+        self._write_lock = asyncio.Lock()
+        self.load()
+        _stores.add(self)
+
+    def load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+        if not raw.strip():
+            return
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not parse {self.filename} ({e}), keeping a copy and starting empty")
+            os.replace(self.filename, f"{self.filename}.corrupt")
+            return
+        self.data = {self.key_type(key): value for key, value in data.items()}
+
+    def __getitem__(self, key):
+        return self.data[self.key_type(key)]
+
+    def __setitem__(self, key, value):
+        self.data[self.key_type(key)] = value
+
+    def __delitem__(self, key):
+        del self.data[self.key_type(key)]
+
+    def __contains__(self, key):
+        try:
+            return self.key_type(key) in self.data
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def snapshot(self):
+        """Shallow-copy the data on the event loop so serialization can run in a thread."""
+        return {str(key): dict(value) if isinstance(value, dict) else value for key, value in self.data.items()}
+
+    def save(self):
+        """Mark the store dirty and schedule a write after the debounce delay."""
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        self._flush_handle = None
+        if not self.dirty:
+            return
+        self.dirty = False
+        snapshot = self.snapshot()
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(lambda: write_json_atomic(self.filename, json.dumps(snapshot)))
+            except Exception as e:
+                self.dirty = True
+                logger.error(f"Failed to save {self.filename}: {e}")
+
+    def flush_sync(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.dirty:
+            self.dirty = False
+            write_json_atomic(self.filename, json.dumps(self.snapshot()))
+
+async def flush_all():
+    """Write every store with pending changes, used on shutdown."""
+    for store in list(_stores):
+        if store._flush_handle is not None:
+            store._flush_handle.cancel()
+        await store.flush()
@@ -0,0 +1,277 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+class ChatMessage(NamedTuple):
+    role: str
+    content: str
+    timestamp: float
+
+class Conversation:
+    __slots__ = ("messages", "language", "language_candidate", "language_streak")
+
+    def __init__(self, history_length, language="id"):
+        self.messages = deque(maxlen=history_length)
+        self.language = language
+        self.language_candidate = None
+        self.language_streak = 0
+
+class MemoryConversationStore:
+    """In-memory chat history with bounded memory and cheap expiry.
+
+    Each user keeps a fixed-size ring buffer of compact message records, the
+    number of users is capped with LRU eviction, and every message is also
+    recorded on a global timeline heap. Because the timeline is ordered by
+    time, expiry only ever looks at the messages that actually expired.
+    """
+
+    def __init__(self, history_length=20, max_users=10000, ttl=3600, default_language="id"):
+        self.history_length = history_length
+        self.max_users = max_users
+        self.ttl = ttl
+        self.default_language = default_language
+        self.users = OrderedDict()
+        self.timeline = []
+
+    async def load(self, user_id):
+        """Make sure the user's conversation is in memory; nothing to do for the in-memory store."""
+
+    async def close(self):
+        pass
+
+    def get(self, user_id):
+        conversation = self.users.get(user_id)
+        if conversation is not None:
+            self.users.move_to_end(user_id)
+        return conversation
+
+    def language(self, user_id):
+        conversation = self.users.get(user_id)
+        return conversation.language if conversation is not None else self.default_language
+
+    def history(self, user_id):
+        conversation = self.users.get(user_id)
+        return conversation.messages if conversation is not None else ()
+
+    def append(self, user_id, role, content):
+        """Record a message and return the user's conversation."""
+        now = time.time()
+        self.expire(now)
+
+        conversation = self.get(user_id)
+        if conversation is None:
+            conversation = Conversation(self.history_length, self.default_language)
+            self.users[user_id] = conversation
+            self.evict_overflow()
+
+        conversation.messages.append(ChatMessage(role, content, now))
+        heapq.heappush(self.timeline, (now, user_id))
+        return conversation
+
+    def evict_overflow(self):
+        while len(self.users) > self.max_users:
+            user_id, conversation = self.users.popitem(last=False)
+            self.on_evict(user_id, conversation)
+
+    def on_evict(self, user_id, conversation):
+        """Called when a user is dropped from memory by the LRU cap."""
+
+    def expire(self, now=None):
+        """Drop messages older than the TTL, and users left with no messages."""
+        cutoff = (now or time.time()) - self.ttl
+        timeline = self.timeline
+        while timeline and timeline[0][0] < cutoff:
+            timestamp, user_id = heapq.heappop(timeline)
+            conversation = self.users.get(user_id)
+            if conversation is None:
+                continue
+            messages = conversation.messages
+            # The ring buffer may already have pushed this message out.
+            if messages and messages[0].timestamp <= timestamp:
+                messages.popleft()
+            if not messages:
+                del self.users[user_id]
+
+    def stats(self):
+        return f"{len(self.users)}/{self.max_users} users, {len(self.timeline)} messages recorded in the last {self.ttl // 60} minutes"
+
+class SQLiteConversationStore(MemoryConversationStore):
+    """Conversation store persisted to SQLite so history survives restarts.
+
+    The in-memory store stays in front as the hot cache, so building context
+    for an active user never touches the database. Writes are batched and
+    run on a single dedicated thread, the database uses WAL, and messages are
+    indexed by (user_id, timestamp) for cold loads and by timestamp so expiry
+    is one indexed DELETE.
+    """
+
+    def __init__(self, path, flush_delay=1.0, batch_size=100, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.flush_delay = flush_delay
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-sqlite")
+        self.connection = None
+        self.pending = []
+        self.dirty_languages = set()
+        self.evicted_languages = {}
+        self.flush_handle = None
+        self.flush_lock = asyncio.Lock()
+        self.last_db_expiry = 0.0
+        self.executor.submit(self._open).result()
+
+    def _open(self):
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_user_time ON messages (user_id, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (timestamp);
+            CREATE TABLE IF NOT EXISTS languages (
+                user_id INTEGER PRIMARY KEY,
+                language TEXT NOT NULL
+            );
+        """)
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def load(self, user_id):
+        if user_id in self.users:
+            return
+
+        # Holding the flush lock means no batch is half-written while the user is read back.
+        async with self.flush_lock:
+            if user_id in self.evicted_languages or any(row[0] == user_id for row in self.pending):
+                await self._flush_locked()
+            cutoff = time.time() - self.ttl
+            rows, language = await self._run(self._read_user, user_id, cutoff)
+            # If that flush failed, the user's newest turns are still only queued here.
+            unwritten = [(role, content, timestamp) for uid, role, content, timestamp in self.pending if uid == user_id]
+            if unwritten:
+                rows = sorted(rows + unwritten, key=lambda row: row[2], reverse=True)[:self.history_length]
+            language = self.evicted_languages.get(user_id, language)
+        if user_id in self.users or not (rows or language):
+            return
+
+        conversation = Conversation(self.history_length, language or self.default_language)
+        for role, content, timestamp in reversed(rows):
+            conversation.messages.append(ChatMessage(role, content, timestamp))
+            heapq.heappush(self.timeline, (timestamp, user_id))
+        self.users[user_id] = conversation
+        self.evict_overflow()
+
+    def _read_user(self, user_id, cutoff):
+        rows = self.connection.execute(
+            "SELECT role, content, timestamp FROM messages WHERE user_id = ? AND timestamp >= ? "
+            "ORDER BY timestamp DESC LIMIT ?",
+            (user_id, cutoff, self.history_length),
+        ).fetchall()
+        language = self.connection.execute("SELECT language FROM languages WHERE user_id = ?", (user_id,)).fetchone()
+        return rows, language[0] if language else None
+
+    def append(self, user_id, role, content):
+        conversation = super().append(user_id, role, content)
+        message = conversation.messages[-1]
+        self.pending.append((user_id, message.role, message.content, message.timestamp))
+        self.dirty_languages.add(user_id)
+        self.schedule_flush()
+        return conversation
+
+    def on_evict(self, user_id, conversation):
+        if user_id in self.dirty_languages:
+            self.evicted_languages[user_id] = conversation.language
+
+    def schedule_flush(self):
+        if len(self.pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        else:
+            self.schedule_delayed_flush()
+
+    def schedule_delayed_flush(self):
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(self.flush_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        async with self.flush_lock:
+            await self._flush_locked()
+
+    async def _flush_locked(self):
+        rows, self.pending = self.pending, []
+        # Languages are read here, after the tracker has updated them for the batched messages.
+        evicted = self.evicted_languages
+        languages = dict(evicted)
+        languages.update(
+            (user_id, self.users[user_id].language)
+            for user_id in self.dirty_languages if user_id in self.users
+        )
+        dirty = self.dirty_languages
+        self.dirty_languages = set()
+        self.evicted_languages = {}
+
+        cutoff = None
+        now = time.time()
+        last_db_expiry = self.last_db_expiry
+        if now - last_db_expiry >= 60:
+            self.last_db_expiry = now
+            cutoff = now - self.ttl
+
+        if not (rows or languages or cutoff is not None):
+            return
+        try:
+            await self._run(self._write, rows, list(languages.items()), cutoff)
+        except Exception as e:
+            # Put the batch back in front of anything queued meanwhile and retry after the usual delay.
+            logger.error(f"Error writing {len(rows)} chat messages to {self.path}, will retry: {e}")
+            self.pending = rows + self.pending
+            self.dirty_languages |= dirty
+            for user_id, language in evicted.items():
+                self.evicted_languages.setdefault(user_id, language)
+            self.last_db_expiry = last_db_expiry
+            if self.connection is not None:
+                self.schedule_delayed_flush()
+
+    def _write(self, rows, languages, cutoff):
+        with self.connection:
+            if rows:
+                self.connection.executemany(
+                    "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)", rows
+                )
+            if languages:
+                self.connection.executemany(
+                    "INSERT INTO languages (user_id, language) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET language = excluded.language",
+                    languages,
+                )
+            if cutoff is not None:
+                self.connection.execute("DELETE FROM messages WHERE timestamp < ?", (cutoff,))
+
+    async def close(self):
+        if self.connection is None:
+            return
+        await self.flush()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        await self._run(self.connection.close)
+        self.connection = None
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import time
+
+REGEX_METACHARACTERS = set(".^$*+?{}[]|()")
+
+def literal_forms(pattern):
+    """Return the exact strings a pattern matches if it is a plain literal (optionally ending in "\\??"), else None."""
+    optional_question = pattern.endswith("\\??")
+    body = pattern[:-3] if optional_question else pattern
+
+    literal = []
+    chars = iter(body)
+    for char in chars:
+        if char == "\\":
+            escaped = next(chars, None)
+            if escaped is None or escaped.isalnum():
+                return None
+            literal.append(escaped)
+        elif char in REGEX_METACHARACTERS:
+            return None
+        else:
+            literal.append(char)
+
+    literal = "".join(literal)
+    return [literal, f"{literal}?"] if optional_question else [literal]
+
+class CustomResponder:
+    """Canned replies answered without calling the LLM.
+
+    Entries are loaded from a JSON file and compiled once: plain literals go
+    into a dict and everything else into a single alternation, so a lookup is
+    one hash probe plus one regex pass however many entries there are. Each
+    entry's reply may be a string, or a dict keyed by "persona_language",
+    persona, language or "default". The file is reloaded when it changes.
+    """
+
+    def __init__(self, filename, reload_interval=5.0):
+        self.filename = filename
+        self.reload_interval = reload_interval
+        self.entries = []
+        self.literals = {}
+        self.combined = None
+        self.group_to_entry = {}
+        self.mtime = None
+        self.last_check = 0.0
+        self.hits = {}
+        self.total_hits = 0
+        self.load()
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.filename)
+            with open(self.filename, 'r') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not load custom responses from {self.filename}: {e}")
+            return False
+
+        entries = config.get("responses", [])
+        literals = {}
+        alternatives = []
+        group_to_entry = {}
+        try:
+            for index, entry in enumerate(entries):
+                forms = literal_forms(entry["pattern"])
+                if forms is not None:
+                    for form in forms:
+                        literals.setdefault(form, index)
+                    continue
+                re.compile(entry["pattern"])
+                group = f"r{index}"
+                group_to_entry[group] = index
+                alternatives.append(f"(?P<{group}>{entry['pattern']})")
+            combined = re.compile("|".join(alternatives)) if alternatives else None
+        except (KeyError, re.error) as e:
+            print(f"Invalid custom response entry in {self.filename}, keeping the previous table: {e}")
+            return False
+
+        self.entries = entries
+        self.literals = literals
+        self.combined = combined
+        self.group_to_entry = group_to_entry
+        self.mtime = mtime
+        self.hits = {entry["pattern"]: self.hits.get(entry["pattern"], 0) for entry in entries}
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self.last_check < self.reload_interval:
+            return
+        self.last_check = now
+        try:
+            mtime = os.path.getmtime(self.filename)
+        except OSError:
+            return
+        if mtime != self.mtime:
+            self.load()
+
+    def match(self, normalized, persona, language):
+        """Return the canned reply for an already stripped and lowercased message, or None."""
+        self.maybe_reload()
+
+        index = self.literals.get(normalized)
+        if self.combined is not None:
+            found = self.combined.fullmatch(normalized)
+            if found is not None:
+                regex_index = self.group_to_entry[found.lastgroup]
+                index = regex_index if index is None else min(index, regex_index)
+        if index is None:
+            return None
+
+        entry = self.entries[index]
+        response = entry["response"]
+        if isinstance(response, dict):
+            for key in (f"{persona}_{language}", persona, language, "default"):
+                if key in response:
+                    response = response[key]
+                    break
+            else:
+                return None
+
+        self.hits[entry["pattern"]] += 1
+        self.total_hits += 1
+        return response
+
+    def stats(self):
+        top = sorted(((count, pattern) for pattern, count in self.hits.items() if count), reverse=True)[:5]
+        top_text = ", ".join(f"`{pattern}` {count}" for count, pattern in top) or "none yet"
+        return f"{len(self.entries)} entries, {self.total_hits} LLM calls saved (top: {top_text})"
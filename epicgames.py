@@ -1,36 +1,52 @@
 import nextcord
 from nextcord.ext import commands, tasks
-import requests
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
 import pytz
-import json
+import hashlib
+import asyncio
+import time
+from http_client import get_http_client, RetryPolicy
+from broadcast import get_broadcaster
+from config_store import ConfigStore
+from message_render import RenderCache, split_message, with_prefix
 
 load_dotenv()
 
+FREE_GAMES_URL = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
+EPIC_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# The feed is polled every minute around a promotion boundary and backs off in between.
+FAST_POLL_MINUTES = 1
+SLOW_POLL_MINUTES = 15
+STATS_REPORT_INTERVAL = 3600
+BOUNDARY_LEAD = timedelta(minutes=10)
+BOUNDARY_TRAIL = timedelta(minutes=20)
+
 class EpicGamesNotifier(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.epic_channels = self.load_data('epic_channels.json')
-        self.role_to_tag = self.load_data('role_to_tag.json')
+        self.http_client = get_http_client(bot)
+        self.broadcaster = get_broadcaster(bot)
+        self.render_cache = RenderCache()
+        self.retry_policy = RetryPolicy(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+        self.last_stats_report = time.monotonic()
+        self.epic_channels = ConfigStore('epic_channels.json', key_type=int)
+        self.role_to_tag = ConfigStore('role_to_tag.json', key_type=int)
         self.scheduled_time = None
-        self.previous_games = []
+        self.free_games = []
+        self.known_offer_keys = set()
+        self.promotion_boundaries = []
+        self.feed_etag = None
+        self.feed_last_modified = None
+        self.feed_digest = None
         self.start_notifier.start()
 
-    def load_data(self, filename):
-        """Load data from a JSON file if it exists; if not, create a new file."""
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                return json.load(f)
-        return {}
-
-    def save_data(self, filename, data):
-        """Save data to a JSON file."""
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+    def cog_unload(self):
+        self.start_notifier.cancel()
+        asyncio.ensure_future(self.epic_channels.flush())
+        asyncio.ensure_future(self.role_to_tag.flush())
 
     def is_admin_or_owner(self, ctx):
         """Check if the user is an admin or the bot owner"""
@@ -40,7 +56,7 @@ class EpicGamesNotifier(commands.Cog):
     @commands.command(name="searcheg")
     async def search_epic(self, ctx, *, game_name):
         """Search for a game on the Epic Games Store by name"""
-        games = self.search_epic_games(game_name)
+        games = await self.search_epic_games(game_name)
         if games:
             message = "**Search Results on the Epic Games Store:**\n"
             for game in games[:5]:
@@ -50,11 +66,12 @@ class EpicGamesNotifier(commands.Cog):
                     f"💸 Price: {game['price']}\n"
                     f"🔗 [Link to Epic Games Store]({game['url']})\n\n"
                 )
-            await ctx.send(message)
+            for chunk in split_message(message):
+                await ctx.send(chunk)
         else:
             await ctx.send("❌ No result found for the search.")
 
-    def search_epic_games(self, game_name):
+    async def search_epic_games(self, game_name):
         """Searching for a game on the Epic Games Store by name"""
         url = "https://store.epicgames.com/api/content/v2/catalog"
         params = {
@@ -64,9 +81,9 @@ class EpicGamesNotifier(commands.Cog):
             "count": 10,
         }
         try:
-            response = self.get_with_retry(url, params=params)
-            if response.status_code != 200:
-                print(f"Error: API return status {response.status_code}")
+            response = await self.get_with_retry(url, params=params)
+            if response.status != 200:
+                print(f"Error: API return status {response.status}")
                 return []
 
             data = response.json()
@@ -89,29 +106,18 @@ class EpicGamesNotifier(commands.Cog):
             print(f"Error while fetching data from the API: {e}")
             return []
 
-    def get_with_retry(self, url, params=None):
+    async def get_with_retry(self, url, params=None, headers=None):
         """A function to make requests with retry"""
-        session = requests.Session()
-        retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount("https://", adapter)
-        session.mount("http://", adapter)
-        return session.get(url, params=params, timeout=30)
+        return await self.http_client.get(url, params=params, headers=headers, timeout=30, retry=self.retry_policy)
 
     @commands.command(name="cg")
     async def check_games(self, ctx):
         """Check the free games currently available on the Epic Games Store."""
-        games = self.get_free_games()
+        games = await self.get_free_games()
         if games:
-            message = "**Free Games on Epic Games Right Now:**\n"
-            for game in games:
-                message += (
-                    f"🎮 **{game['title']}**\n"
-                    f"{game['description']}\n"
-                    f"📅 Free from {game['start_date']} to {game['end_date']}\n"
-                    f"🔗 [Claim Now](https://store.epicgames.com/p/{game['title'].replace(' ', '-').lower()})\n\n"
-                )
-            await ctx.send(message)
+            body = self.render_cache.render(games, self.render_free_games)
+            for chunk in with_prefix("**Free Games on Epic Games Right Now:**\n", body):
+                await ctx.send(chunk)
         else:
             await ctx.send("⚠️ No free games available right now.")
 
@@ -127,7 +133,7 @@ class EpicGamesNotifier(commands.Cog):
             return
 
         self.epic_channels[ctx.guild.id] = channel.id
-        self.save_data('epic_channels.json', self.epic_channels)
+        self.epic_channels.save()
         await ctx.send(f"✅ Epic Games Notifications channel for this server has been set to {channel.mention}")
 
     @commands.command(name="scheg")
@@ -165,7 +171,7 @@ class EpicGamesNotifier(commands.Cog):
             return
         
         self.role_to_tag[ctx.guild.id] = role.id
-        self.save_data('role_to_tag.json', self.role_to_tag)
+        self.role_to_tag.save()
         await ctx.send(f"✅ The role {role.mention} has been set to be tagged in the free game notifications.")
 
     @commands.command(name="rmvegr")
@@ -177,7 +183,7 @@ class EpicGamesNotifier(commands.Cog):
 
         if ctx.guild.id in self.role_to_tag and self.role_to_tag[ctx.guild.id] == role.id:
             del self.role_to_tag[ctx.guild.id]
-            self.save_data('role_to_tag.json', self.role_to_tag)
+            self.role_to_tag.save()
             await ctx.send(f"✅ The role {role.mention} has been removed from the free game notifications.")
         else:
             await ctx.send(f"⚠️ The role {role.mention} is not found in the settings for notifications in this server.")
@@ -223,63 +229,125 @@ class EpicGamesNotifier(commands.Cog):
 
         await ctx.send(message)
 
-    @tasks.loop(minutes=1)
+    @tasks.loop(minutes=FAST_POLL_MINUTES)
     async def start_notifier(self):
         """Task loop for automatic notifications in all servers."""
-        games = self.get_free_games()
+        # The poll interval changes, so report on elapsed time rather than a poll count.
+        now = time.monotonic()
+        if now - self.last_stats_report >= STATS_REPORT_INTERVAL:
+            self.last_stats_report = now
+            self.report_connection_stats()
+
+        games = await self.get_free_games()
+        self.adjust_poll_interval()
         if not games:
             return
 
-        new_games = [game for game in games if game not in self.previous_games]
+        new_games = [game for game in games if game["offer_key"] not in self.known_offer_keys]
 
         if new_games:
+            body = self.render_cache.render(new_games, self.render_free_games)
+            targets = []
             for guild_id, channel_id in self.epic_channels.items():
-                channel = self.bot.get_channel(channel_id)
-                if channel:
-                    role_id = self.role_to_tag.get(guild_id)
-                    role_mention = f"<@&{role_id}>" if role_id else "everyone"
-                    message = f"**New Free Games on Epic Games Right Now:**\n{role_mention}\n"
-                    for game in new_games:
-                        message += (
-                            f"🎮 **{game['title']}**\n"
-                            f"{game['description']}\n"
-                            f"📅 Free from {game['start_date']} to {game['end_date']}\n"
-                            f"🔗 [Claim Now](https://store.epicgames.com/p/{game['title'].replace(' ', '-').lower()})\n\n"
-                        )
-                    await channel.send(message)
-
-            self.previous_games = games
-
-    def get_free_games(self):
-        """Get free games data from the Epic Games Store API."""
-        url = "https://store-site-backend-static.ak.epicgames.com/freeGamesPromotions"
+                role_id = self.role_to_tag.get(guild_id)
+                role_mention = f"<@&{role_id}>" if role_id else "everyone"
+                header = f"**New Free Games on Epic Games Right Now:**\n{role_mention}\n"
+                targets.append((guild_id, channel_id, with_prefix(header, body)))
+            await self.broadcaster.broadcast(targets, label="Epic Games free games")
+
+            self.known_offer_keys = {game["offer_key"] for game in games}
+
+    def render_free_games(self, games):
+        """Build the game list shared by every guild's notification."""
+        return "".join(
+            f"🎮 **{game['title']}**\n"
+            f"{game['description']}\n"
+            f"📅 Free from {game['start_date']} to {game['end_date']}\n"
+            f"🔗 [Claim Now]({game['url']})\n\n"
+            for game in games
+        )
+
+    def adjust_poll_interval(self):
+        """Poll every minute around a promotion start/end and back off the rest of the week."""
+        now = datetime.now(timezone.utc)
+        minutes = SLOW_POLL_MINUTES
+        for boundary in self.promotion_boundaries:
+            if boundary - BOUNDARY_LEAD <= now <= boundary + BOUNDARY_TRAIL:
+                minutes = FAST_POLL_MINUTES
+                break
+            if boundary > now:
+                until_lead = (boundary - BOUNDARY_LEAD - now).total_seconds() / 60
+                minutes = max(FAST_POLL_MINUTES, min(minutes, int(until_lead)))
+        if minutes != self.start_notifier.minutes:
+            self.start_notifier.change_interval(minutes=minutes)
+
+    def report_connection_stats(self):
+        """Print how often the Epic endpoints reused a pooled connection."""
+        for host in ("store-site-backend-static.ak.epicgames.com", "store.epicgames.com"):
+            if host in self.http_client.stats:
+                print(f"Epic Games connection stats for {host}: {self.http_client.stats[host]}")
+
+    async def get_free_games(self):
+        """Get free games data from the Epic Games Store API, reusing the last result when the feed is unchanged."""
+        headers = {}
+        if self.feed_etag:
+            headers["If-None-Match"] = self.feed_etag
+        if self.feed_last_modified:
+            headers["If-Modified-Since"] = self.feed_last_modified
+
         try:
-            response = self.get_with_retry(url)
-            if response.status_code != 200:
-                print(f"Error: API returned status {response.status_code}")
+            response = await self.get_with_retry(FREE_GAMES_URL, headers=headers)
+            if response.status == 304:
+                return self.free_games
+            if response.status != 200:
+                print(f"Error: API returned status {response.status}")
                 return []
 
-            data = response.json()
-            games = []
+            digest = hashlib.sha256(response.body).hexdigest()
+            if digest != self.feed_digest:
+                self.free_games, self.promotion_boundaries = self.parse_free_games(response.json())
 
-            for game in data["data"]["Catalog"]["searchStore"]["elements"]:
-                if game.get("promotions") and game["promotions"].get("promotionalOffers"):
-                    offers = game["promotions"]["promotionalOffers"][0]["promotionalOffers"]
-                    for offer in offers:
-                        start_date = offer["startDate"]
-                        end_date = offer["endDate"]
-                        price_info = game.get("price", {}).get("totalPrice", {})
-                        if price_info.get("originalPrice", 0) == 0:
-                            games.append({
-                                "title": game["title"],
-                                "description": game.get("description", "No description."),
-                                "start_date": datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%d %B %Y"),
-                                "end_date": datetime.strptime(end_date, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%d %B %Y"),
-                            })
-            return games
+            # Only remember the validators once the body parsed, so a failed parse is retried on the next poll
+            # instead of being hidden behind 304 responses.
+            self.feed_etag = response.headers.get("ETag")
+            self.feed_last_modified = response.headers.get("Last-Modified")
+            self.feed_digest = digest
+            return self.free_games
         except Exception as e:
             print(f"Error while fetching data from API: {e}")
             return []
 
+    def parse_free_games(self, data):
+        """Extract the free offers and the upcoming promotion start/end times from the feed."""
+        games = []
+        boundaries = set()
+
+        for game in data["data"]["Catalog"]["searchStore"]["elements"]:
+            promotions = game.get("promotions") or {}
+            for upcoming in promotions.get("upcomingPromotionalOffers") or []:
+                for offer in upcoming.get("promotionalOffers", []):
+                    boundaries.add(self.parse_epic_date(offer["startDate"]))
+
+            if promotions.get("promotionalOffers"):
+                offers = promotions["promotionalOffers"][0]["promotionalOffers"]
+                for offer in offers:
+                    starts_at = self.parse_epic_date(offer["startDate"])
+                    ends_at = self.parse_epic_date(offer["endDate"])
+                    boundaries.add(ends_at)
+                    price_info = game.get("price", {}).get("totalPrice", {})
+                    if price_info.get("originalPrice", 0) == 0:
+                        games.append({
+                            "title": game["title"],
+                            "description": game.get("description", "No description."),
+                            "start_date": starts_at.strftime("%d %B %Y"),
+                            "end_date": ends_at.strftime("%d %B %Y"),
+                            "url": f"https://store.epicgames.com/p/{game['title'].replace(' ', '-').lower()}",
+                            "offer_key": (game["title"], offer["startDate"]),
+                        })
+        return games, sorted(boundaries)
+
+    def parse_epic_date(self, value):
+        return datetime.strptime(value, EPIC_DATE_FORMAT).replace(tzinfo=timezone.utc)
+
 def setup(bot):
     bot.add_cog(EpicGamesNotifier(bot))
@@ -0,0 +1,158 @@
+import aiohttp
+import asyncio
+import json
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class HTTPStatusError(aiohttp.ClientError):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+class HTTPResponse:
+    """Fully read response, safe to use after the connection went back to the pool."""
+
+    def __init__(self, status, headers, body, url):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise HTTPStatusError(self.status, self.url)
+
+class RetryPolicy:
+    """Retry settings built once and shared by every request that uses them."""
+
+    def __init__(self, total=3, backoff_factor=1, status_forcelist=RETRY_STATUSES):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.status_forcelist = frozenset(status_forcelist)
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before the next attempt, honouring Retry-After when present."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return int(retry_after)
+        return self.backoff_factor * (2 ** (attempt - 1))
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    @property
+    def reuse_ratio(self):
+        total = self.connections_created + self.connections_reused
+        return self.connections_reused / total if total else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.requests} requests, {self.connections_created} new connections, "
+            f"{self.connections_reused} reused ({self.reuse_ratio:.0%})"
+        )
+
+class HTTPClient:
+    """Bot-wide async HTTP client with pooled keep-alive connections and retry/backoff."""
+
+    def __init__(self, limit=100, limit_per_host=8, timeout=30, retry=None, keepalive_timeout=60):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.keepalive_timeout = keepalive_timeout
+        self.stats = defaultdict(HostStats)
+        self._session = None
+
+    def _trace_config(self):
+        """Count new versus reused pooled connections per host."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.host = params.url.host
+            self.stats[context.host].requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.stats[context.host].connections_created += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.stats[context.host].connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def _get_session(self):
+        """Create the session lazily so it is bound to the running event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    async def request(self, method, url, *, params=None, headers=None, data=None, timeout=None, retry=None):
+        """Send a request, retrying connection errors and 429/5xx responses with exponential backoff."""
+        session = self._get_session()
+        retry = retry or self.retry
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with session.request(method, url, params=params, headers=headers, data=data, timeout=request_timeout) as resp:
+                    body = await resp.read()
+                    response = HTTPResponse(resp.status, resp.headers, body, str(resp.url))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt > retry.total:
+                    raise
+                delay = retry.backoff(attempt)
+                logger.warning(f"Request to {url} failed ({e!r}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status in retry.status_forcelist and attempt <= retry.total:
+                delay = retry.backoff(attempt, response)
+                logger.warning(f"Request to {url} returned {response.status}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+                continue
+
+            return response
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+def get_http_client(bot):
+    """Return the HTTP client shared by every cog, creating it on first use."""
+    client = getattr(bot, "http_client", None)
+    if client is None:
+        client = HTTPClient()
+        bot.http_client = client
+    return client
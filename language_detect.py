@@ -0,0 +1,99 @@
+import re
+from langdetect import detect
+
+EN_WORDS = frozenset("""
+a about after all am an and any are as at be because been but by can could did do does doing don't for from
+get good got had has have he hello her here hey him his how i i'm if in into is it it's its just know like me
+morning my night no not now of on or our out please really she should so some than thank thanks that the their
+them then there they think this to too up us very was we were what when where which who why will with would
+yeah yes you you're your
+""".split())
+
+ID_WORDS = frozenset("""
+ada adalah aja akan aku anda apa atau bagaimana bakal banget belum benar bisa boleh buat bukan cuma dan dari
+deh dengan di dia dong ga gak gimana gue hari harus ini itu iya jadi jangan juga kah kalau kami kamu kan kapan
+karena ke kenapa kita kok lagi lah makasih malam masih mau mereka ngapain nggak nih nya pada pagi saja sama
+sampai sangat saya sedang sekarang selamat siapa sih sudah supaya tapi tau tentang terus tidak udah untuk wkwk
+ya yang yuk
+""".split())
+
+ID_SUFFIXES = ("nya", "kan", "lah")
+
+WORD_RE = re.compile(r"[a-z']+")
+
+class LanguageClassifier:
+    """Fast en/id classifier based on function words, falling back to langdetect only when unsure."""
+
+    def __init__(self, threshold=0.7, min_evidence=2):
+        self.threshold = threshold
+        self.min_evidence = min_evidence
+        self.fast_calls = 0
+        self.fallback_calls = 0
+
+    def score(self, text):
+        """Return (en_evidence, id_evidence) for a message."""
+        en = id_ = 0
+        for word in WORD_RE.findall(text.lower()):
+            if word in ID_WORDS:
+                id_ += 1
+            elif word in EN_WORDS:
+                en += 1
+            elif len(word) > 5 and word.endswith(ID_SUFFIXES):
+                id_ += 1
+        return en, id_
+
+    def classify(self, text):
+        """Return (language, confidence); language is "en", "id" or None when nothing could be decided."""
+        language, confidence, _ = self.classify_with_evidence(text)
+        return language, confidence
+
+    def classify_with_evidence(self, text):
+        """Like classify, plus how many words backed the decision (0 when langdetect decided)."""
+        en, id_ = self.score(text)
+        total = en + id_
+        if total >= self.min_evidence:
+            confidence = max(en, id_) / total
+            if confidence >= self.threshold:
+                self.fast_calls += 1
+                return ("en" if en > id_ else "id"), confidence, total
+
+        self.fallback_calls += 1
+        try:
+            language = detect(text)
+        except Exception:
+            return None, 0.0, 0
+        return (language, 0.5, 0) if language in ("en", "id") else (None, 0.0, 0)
+
+class UserLanguageTracker:
+    """Keep a per-user language that only flips on a long, confident message or two agreeing ones in a row.
+
+    A short message like "thank you" can be fully confident from two words, so
+    skipping the streak also needs `switch_evidence` classified words.
+    """
+
+    def __init__(self, classifier, switch_confidence=0.9, switch_streak=2, switch_evidence=4, default="id"):
+        self.classifier = classifier
+        self.switch_confidence = switch_confidence
+        self.switch_streak = switch_streak
+        self.switch_evidence = switch_evidence
+        self.default = default
+
+    def update(self, conversation, text):
+        """Update the conversation's language from a new user message and return it."""
+        current = conversation.language or self.default
+        language, confidence, evidence = self.classifier.classify_with_evidence(text)
+        if language is None or language == current:
+            conversation.language_candidate, conversation.language_streak = None, 0
+            return current
+
+        if conversation.language_candidate == language:
+            conversation.language_streak += 1
+        else:
+            conversation.language_candidate, conversation.language_streak = language, 1
+
+        confident = confidence >= self.switch_confidence and evidence >= self.switch_evidence
+        if confident or conversation.language_streak >= self.switch_streak:
+            conversation.language = language
+            conversation.language_candidate, conversation.language_streak = None, 0
+            return language
+        return current
@@ -0,0 +1,36 @@
+import asyncio
+import time
+from collections import deque
+
+class LoopLagMonitor:
+    """Measure event-loop lag as how late a short periodic sleep wakes up.
+
+    Anything that blocks the loop (sync I/O, heavy CPU work) delays the next
+    wake-up by the same amount, so the recorded samples show how long the bot
+    was unresponsive and when.
+    """
+
+    def __init__(self, interval=0.05, history=1200):
+        self.interval = interval
+        self.samples = deque(maxlen=history)
+        self.task = None
+
+    def start(self, loop):
+        if self.task is None:
+            self.task = loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.samples.append((now, max(0.0, now - expected)))
+
+    def max_lag_since(self, since):
+        """Worst lag in seconds among the samples taken since the given time.monotonic() value."""
+        return max((lag for taken, lag in self.samples if taken >= since), default=0.0)
@@ -2,6 +2,8 @@ import nextcord
 from nextcord.ext import commands
 from dotenv import load_dotenv
 import os
+from http_client import get_http_client
+from config_store import flush_all
 
 load_dotenv()
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -9,7 +11,16 @@ TOKEN = os.getenv("DISCORD_BOT_TOKEN")
 intents = nextcord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(command_prefix='y!', intents=intents)
+class YuukiBot(commands.Bot):
+    async def close(self):
+        for cog in list(self.cogs.values()):
+            if hasattr(cog, "shutdown"):
+                await cog.shutdown()
+        await flush_all()
+        await get_http_client(self).close()
+        await super().close()
+
+bot = YuukiBot(command_prefix='y!', intents=intents)
 
 @bot.command(name="h")
 async def send_help_message(ctx):
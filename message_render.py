@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Room left in the first chunk for per-guild parts such as a header and role mention.
+PREFIX_RESERVE = 100
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT):
+    """Split text into chunks of at most `limit` characters, breaking on blank lines, then lines, then spaces."""
+    chunks = []
+    while len(text) > limit:
+        window = text[:limit]
+        cut = window.rfind("\n\n")
+        if cut <= 0:
+            cut = window.rfind("\n")
+        if cut <= 0:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip("\n ")
+    if text:
+        chunks.append(text)
+    return chunks
+
+def content_hash(content):
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def with_prefix(prefix, chunks):
+    """Attach a per-target prefix to a pre-rendered body without re-rendering it."""
+    if not chunks:
+        return [prefix] if prefix else []
+    return [prefix + chunks[0], *chunks[1:]]
+
+class RenderCache:
+    """Render each notification body once per distinct content and keep it pre-split for Discord."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def _entry(self, content, renderer, limit):
+        key = (content_hash(content), limit)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry
+
+        text = renderer(content)
+        entry = (text, split_message(text, limit))
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def render(self, content, renderer, limit=DISCORD_MESSAGE_LIMIT - PREFIX_RESERVE):
+        """Return the body chunks for `content`, calling `renderer(content)` only on a cache miss."""
+        return self._entry(content, renderer, limit)[1]
+
+    def render_text(self, content, renderer):
+        """Return the unsplit body for `content`, for callers that embed it in a larger message."""
+        return self._entry(content, renderer, DISCORD_MESSAGE_LIMIT - PREFIX_RESERVE)[0]
+
+class StreamingReply:
+    """Reply as soon as text arrives, then edit in throttled steps and spill past the limit into follow-ups."""
+
+    def __init__(self, ctx, edit_interval=1.0, limit=DISCORD_MESSAGE_LIMIT):
+        self.ctx = ctx
+        self.edit_interval = edit_interval
+        self.limit = limit
+        self.messages = []
+        self.contents = []
+        self.started = time.perf_counter()
+        self.last_sync = 0.0
+        self.time_to_first_token = None
+
+    async def update(self, text):
+        """Called with the accumulated text; only touches Discord once per edit interval."""
+        if self.messages and time.perf_counter() - self.last_sync < self.edit_interval:
+            return
+        await self._sync(text)
+
+    async def finish(self, text):
+        await self._sync(text)
+
+    async def _sync(self, text):
+        chunks = split_message(text, self.limit)
+        if not chunks:
+            return
+        for i, chunk in enumerate(chunks):
+            if i < len(self.messages):
+                if self.contents[i] != chunk:
+                    await self.messages[i].edit(content=chunk)
+                    self.contents[i] = chunk
+            else:
+                message = await (self.ctx.reply(chunk) if i == 0 else self.ctx.send(chunk))
+                self.messages.append(message)
+                self.contents.append(chunk)
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - self.started
+        # The final text can be shorter than what was streamed (an error fallback), so drop stale follow-ups.
+        while len(self.messages) > len(chunks):
+            message = self.messages.pop()
+            self.contents.pop()
+            try:
+                await message.delete()
+            except Exception as e:
+                print(f"Could not delete a stale streamed message: {e}")
+        self.last_sync = time.perf_counter()
@@ -1,16 +1,209 @@
 import nextcord
 import asyncio
+import os
+import threading
+import time
 import yt_dlp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from nextcord.ext import commands
+from loop_monitor import LoopLagMonitor
+from ytdl_cache import ExtractionCache, video_key
+
+IDLE = "idle"
+RESOLVING = "resolving"
+PLAYING = "playing"
+PAUSED = "paused"
+
+class GuildPlayer:
+    """Playback state for one guild: voice client, queue and a small state machine.
+
+    States go idle -> resolving -> playing <-> paused, and back to resolving
+    or idle when a track ends. advance() is the only place a track changes and
+    runs under a lock; every started track gets a new generation number, and
+    callbacks or resolutions from an older generation are ignored, so a skip
+    or stop can never advance the queue twice. After `idle_timeout` seconds
+    without playing, the player leaves the voice channel.
+    """
+
+    def __init__(self, cog, guild_id, idle_timeout=300):
+        self.cog = cog
+        self.guild_id = guild_id
+        self.idle_timeout = idle_timeout
+        self.voice_client = None
+        self.channel = None
+        self.queue = deque()
+        self.state = IDLE
+        self.generation = 0
+        self.lock = asyncio.Lock()
+        self.prefetched = {}
+        self.track_ended = None
+        self.idle_handle = None
+
+    def is_connected(self):
+        return self.voice_client is not None and self.voice_client.is_connected()
+
+    def set_state(self, state):
+        self.state = state
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+        if state == IDLE and self.is_connected():
+            loop = asyncio.get_running_loop()
+            self.idle_handle = loop.call_later(self.idle_timeout, lambda: asyncio.ensure_future(self.leave_if_idle()))
+
+    async def send(self, content):
+        if self.channel is not None:
+            await self.channel.send(content)
+
+    def enqueue(self, url, title):
+        self.queue.append((url, title))
+        if self.state != IDLE:
+            self.prefetch_upcoming()
+
+    async def start(self):
+        """Start playing the queue if nothing is playing yet."""
+        if self.state == IDLE:
+            await self.advance(self.generation)
+
+    def on_track_end(self, generation, error, loop):
+        """`after` callback of the voice client; runs on the player thread."""
+        if error:
+            print(f"Player error: {error}")
+        loop.call_soon_threadsafe(self.track_finished, generation)
+
+    def track_finished(self, generation):
+        if generation != self.generation:
+            return
+        self.track_ended = time.monotonic()
+        asyncio.ensure_future(self.advance(generation))
+
+    async def advance(self, generation):
+        """Replace the track of the given generation with the next playable one in the queue."""
+        async with self.lock:
+            if generation != self.generation:
+                return
+            self.generation += 1
+            generation = self.generation
+
+            while self.queue and self.is_connected():
+                url, title = self.queue.popleft()
+                self.set_state(RESOLVING)
+                try:
+                    data, source = await self.resolve_stream(url)
+                    audio = self.cog.create_source(data)
+                except Exception as e:
+                    print(f"Error playing the song: {e}")
+                    await self.send("Error playing the song.")
+                    continue
+
+                if generation != self.generation or not self.is_connected():
+                    # Stopped while the stream was being resolved.
+                    audio.cleanup()
+                    return
+
+                print(f"Playing song: {data['url']}")
+                loop = asyncio.get_running_loop()
+                self.voice_client.play(audio, after=lambda e: self.on_track_end(generation, e, loop))
+                self.set_state(PLAYING)
+                if self.track_ended is not None:
+                    gap = time.monotonic() - self.track_ended
+                    print(f"Track transition in guild {self.guild_id}: {gap * 1000:.0f} ms gap ({source})")
+                    self.track_ended = None
+                self.prefetch_upcoming()
+                await self.send(f"Now playing: {title}")
+                return
+
+            self.track_ended = None
+            self.set_state(IDLE)
+
+    def skip(self):
+        """Stop the current track so its `after` callback advances the queue; False if nothing is playing."""
+        if self.state not in (PLAYING, PAUSED):
+            return False
+        self.voice_client.stop()
+        return True
+
+    def pause(self):
+        if self.state == PLAYING:
+            self.voice_client.pause()
+            self.set_state(PAUSED)
+
+    def resume(self):
+        if self.state == PAUSED:
+            self.voice_client.resume()
+            self.set_state(PLAYING)
+
+    def reset(self):
+        """Forget the queue and make any pending callback or resolution stale."""
+        self.generation += 1
+        self.queue.clear()
+        self.track_ended = None
+        self.prefetch_upcoming()
+        self.state = IDLE
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+
+    async def stop(self):
+        self.reset()
+        if self.voice_client is not None:
+            self.voice_client.stop()
+            await self.voice_client.disconnect()
+
+    async def leave_if_idle(self):
+        self.idle_handle = None
+        if self.state != IDLE or not self.is_connected():
+            return
+        await self.stop()
+        if self.cog.players.get(self.guild_id) is self:
+            del self.cog.players[self.guild_id]
+        await self.send(f"Left the voice channel after {self.idle_timeout // 60} minutes without music.")
+
+    def prefetch_upcoming(self):
+        """Start resolving the next few queued tracks, and forget prefetches that left that window."""
+        upcoming = [url for url, _ in islice(self.queue, self.cog.prefetch_depth)]
+        for url in list(self.prefetched):
+            if url not in upcoming:
+                self.prefetched.pop(url).cancel()
+        for url in upcoming:
+            task = self.prefetched.get(url)
+            if task is None or (task.done() and not self.is_fresh(task)):
+                task = self.prefetched[url] = asyncio.ensure_future(self.cog.get_stream_info(url))
+                task.add_done_callback(lambda task, url=url: self.prefetch_done(url, task))
+
+    def prefetch_done(self, url, task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Prefetching {url} failed: {task.exception()!r}")
+
+    def is_fresh(self, task):
+        if task.cancelled() or task.exception() is not None:
+            return False
+        return self.cog.extraction_cache.is_fresh(task.result())
+
+    async def resolve_stream(self, url):
+        """Return (info, source), reusing a prefetched or cached extraction unless it failed or is about to expire."""
+        task = self.prefetched.pop(url, None)
+        if task is not None:
+            if not task.done():
+                try:
+                    return await task, "prefetched"
+                except Exception:
+                    pass
+            elif self.is_fresh(task):
+                return task.result(), "prefetched"
+        cached = video_key(url) in self.cog.extraction_cache.videos
+        return await self.cog.get_stream_info(url), "cached" if cached else "resolved on demand"
 
 class MusicPlayer(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.voice_clients = {}
-        self.queue = {}
-        self.is_playing = {}
+        self.players = {}
+        self.idle_timeout = int(os.getenv("MUSIC_IDLE_TIMEOUT", 300))
         self.yt_dlp_options = {
-            "format": "bestaudio/best",
+            # Opus audio can be sent to Discord as is, so prefer it over other audio formats.
+            "format": "bestaudio[acodec=opus]/bestaudio/best",
             "cookiefile": "C:\\Users\\MyBook Hype AMD\\Desktop\\Yuuki\\cookies.json",
             "outtmpl": "downloads/%(id)s.%(ext)s",
             "postprocessors": [{
@@ -21,43 +214,127 @@ class MusicPlayer(commands.Cog):
             "noplaylist": True,
             "quiet": True,
         }
-        self.ytdl = yt_dlp.YoutubeDL(self.yt_dlp_options)
-        self.ffmpeg_options = {'options': '-vn -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'}
+        self.ffmpeg_options = {
+            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+            'options': '-vn',
+        }
+        self.opus_streams = 0
+        self.pcm_streams = 0
+
+        # yt-dlp extraction is blocking, so it runs on its own small pool instead of the
+        # event loop or the default executor, with one YoutubeDL instance per worker thread.
+        self.ytdl_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("YTDL_WORKERS", 2)), thread_name_prefix="ytdl"
+        )
+        self.ytdl_local = threading.local()
+        self.ytdl_timeout = float(os.getenv("YTDL_TIMEOUT", 20))
+        self.pending_searches = {}
+        self.extraction_cache = ExtractionCache()
+        self.inflight = {}
+        self.user_id = int(os.getenv("USER_ID", 0))
+
+        # Stream URLs for the next queued tracks are resolved while the current one plays.
+        self.prefetch_depth = int(os.getenv("MUSIC_PREFETCH", 2))
+
+        self.lag_monitor = LoopLagMonitor()
+        self.lag_monitor.start(self.bot.loop)
+
+    async def shutdown(self):
+        self.lag_monitor.stop()
+        for task in self.pending_searches.values():
+            task.cancel()
+        for player in self.players.values():
+            player.reset()
+        self.ytdl_executor.shutdown(wait=False, cancel_futures=True)
+
+    def cog_unload(self):
+        asyncio.ensure_future(self.shutdown())
+
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(self, guild_id, self.idle_timeout)
+        return player
 
     @commands.Cog.listener()
     async def on_ready(self):
         print(f'{self.bot.user} is now jamming')
 
-    def search_youtube(self, query):
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        """Drop a member's pending search when they leave or switch voice channels, and reset on bot disconnects."""
+        if before.channel is None or before.channel == after.channel:
+            return
+        if member.id == self.bot.user.id and after.channel is None:
+            player = self.players.pop(member.guild.id, None)
+            if player is not None:
+                player.reset()
+            return
+        task = self.pending_searches.get((member.guild.id, member.id))
+        if task is not None:
+            task.cancel()
+
+    def get_ytdl(self):
+        ytdl = getattr(self.ytdl_local, "ytdl", None)
+        if ytdl is None:
+            ytdl = self.ytdl_local.ytdl = yt_dlp.YoutubeDL(self.yt_dlp_options)
+        return ytdl
+
+    async def extract_info(self, url):
+        """Run yt-dlp extraction on the worker pool, giving up after ytdl_timeout seconds.
+
+        A timed-out extraction keeps its worker until yt-dlp returns, but the
+        result is discarded and the caller is not kept waiting.
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.ytdl_executor, lambda: self.get_ytdl().extract_info(url, download=False)),
+            self.ytdl_timeout,
+        )
+
+    async def search_youtube(self, query):
+        cached = self.extraction_cache.get_search(query)
+        if cached is not None:
+            return cached
         try:
-            result = self.ytdl.extract_info(f"ytsearch:{query}", download=False)
+            result = await self.extract_info(f"ytsearch:{query}")
             video = result['entries'][0]
+            self.extraction_cache.set_search(query, video)
+            # The search already resolved the stream, so playback can use it without extracting again.
+            if 'url' in video:
+                self.extraction_cache.set_video(video['webpage_url'], video)
             return video['webpage_url'], video['title']
+        except asyncio.TimeoutError:
+            print(f"YouTube search for {query!r} timed out after {self.ytdl_timeout:.0f}s")
+            return None, None
         except Exception as e:
             print(f"Error searching on YouTube: {e}")
             return None, None
 
-    async def play_next(self, ctx):
-        if len(self.queue[ctx.guild.id]) > 0:
-            url, title = self.queue[ctx.guild.id].pop(0)
-            await self.play_song(ctx, url, title)
-        else:
-            self.is_playing[ctx.guild.id] = False
+    async def get_stream_info(self, url):
+        """Return playback info for a video URL from the cache, sharing one extraction between concurrent callers."""
+        info = self.extraction_cache.get_video(url)
+        if info is not None:
+            return info
+        key = video_key(url)
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(self.extract_stream_info(url))
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
 
-    async def play_song(self, ctx, url, title):
-        try:
-            loop = asyncio.get_event_loop()
-            data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(url, download=False))
+    async def extract_stream_info(self, url):
+        return self.extraction_cache.set_video(url, await self.extract_info(url))
 
-            song = data['url']
-            print(f"Playing song: {song}")
-            player = nextcord.FFmpegPCMAudio(song, **self.ffmpeg_options)
-
-            self.voice_clients[ctx.guild.id].play(player, after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), loop))
-            await ctx.send(f"Now playing: {title}")
-        except Exception as e:
-            print(f"Error playing the song: {e}")
-            await ctx.send("Error playing the song.")
+    def create_source(self, data):
+        """Copy Opus streams straight through to Discord; anything else is decoded to PCM and re-encoded."""
+        if data.get('acodec') == 'opus':
+            self.opus_streams += 1
+            # nextcord turns codec "opus" into FFmpeg's "-c:a copy"; any other value, "copy" included, re-encodes with libopus.
+            return nextcord.FFmpegOpusAudio(data['url'], codec='opus', **self.ffmpeg_options)
+        self.pcm_streams += 1
+        print(f"No Opus audio for {data.get('title', data['url'])} ({data.get('acodec')}), transcoding")
+        return nextcord.FFmpegPCMAudio(data['url'], **self.ffmpeg_options)
 
     @commands.command(name="play")
     async def play(self, ctx, *, search: str):
@@ -65,16 +342,12 @@ class MusicPlayer(commands.Cog):
             await ctx.send("You need to be connected to a voice channel to play music.")
             return
 
-        if ctx.guild.id not in self.queue:
-            self.queue[ctx.guild.id] = []
+        player = self.get_player(ctx.guild.id)
+        player.channel = ctx.channel
 
-        if ctx.guild.id not in self.is_playing:
-            self.is_playing[ctx.guild.id] = False
-
-        if ctx.guild.id not in self.voice_clients or not self.voice_clients[ctx.guild.id].is_connected():
+        if not player.is_connected():
             try:
-                voice_client = await ctx.author.voice.channel.connect()
-                self.voice_clients[voice_client.guild.id] = voice_client
+                player.voice_client = await ctx.author.voice.channel.connect()
                 print("Connected to voice channel")
             except Exception as e:
                 print(f"Error connecting to the voice channel: {e}")
@@ -82,7 +355,19 @@ class MusicPlayer(commands.Cog):
                 return
 
         if not search.startswith("http"):
-            url, title = self.search_youtube(search)
+            started = time.monotonic()
+            key = (ctx.guild.id, ctx.author.id)
+            task = self.pending_searches[key] = asyncio.ensure_future(self.search_youtube(search))
+            try:
+                url, title = await task
+            except asyncio.CancelledError:
+                await ctx.send("Search cancelled because you left the voice channel.")
+                return
+            finally:
+                if self.pending_searches.get(key) is task:
+                    del self.pending_searches[key]
+            lag = self.lag_monitor.max_lag_since(started)
+            print(f"y!play search took {time.monotonic() - started:.2f}s, max event loop lag {lag * 1000:.1f} ms")
             if url is None:
                 await ctx.send("Could not find the song on YouTube.")
                 return
@@ -90,58 +375,74 @@ class MusicPlayer(commands.Cog):
             url = search
             title = "Playing from provided URL"
 
-        self.queue[ctx.guild.id].append((url, title))
+        player.enqueue(url, title)
         await ctx.send(f"Added to queue: {title}")
-
-        if not self.is_playing[ctx.guild.id]:
-            self.is_playing[ctx.guild.id] = True
-            await self.play_next(ctx)
+        await player.start()
 
     @commands.command(name="pause")
     async def pause(self, ctx):
-        try:
-            self.voice_clients[ctx.guild.id].pause()
-        except Exception as e:
-            print(e)
+        player = self.players.get(ctx.guild.id)
+        if player is not None:
+            player.pause()
 
     @commands.command(name="resume")
     async def resume(self, ctx):
-        try:
-            self.voice_clients[ctx.guild.id].resume()
-        except Exception as e:
-            print(e)
+        player = self.players.get(ctx.guild.id)
+        if player is not None:
+            player.resume()
 
     @commands.command(name="skip")
     async def skip(self, ctx):
-        if ctx.guild.id in self.voice_clients:
-            self.voice_clients[ctx.guild.id].stop()
-            await self.play_next(ctx)
+        player = self.players.get(ctx.guild.id)
+        if player is None or not player.skip():
+            await ctx.send("Nothing is playing.")
 
     @commands.command(name="stop")
     async def stop(self, ctx):
+        player = self.players.pop(ctx.guild.id, None)
+        if player is None:
+            return
         try:
-            self.voice_clients[ctx.guild.id].stop()
-            await self.voice_clients[ctx.guild.id].disconnect()
-            self.queue[ctx.guild.id] = []
-            self.is_playing[ctx.guild.id] = False
+            await player.stop()
         except Exception as e:
             print(e)
 
     @commands.command(name="q")
     async def show_queue(self, ctx):
-        if ctx.guild.id in self.queue and self.queue[ctx.guild.id]:
-            queue_str = "\n".join([f"{i+1}. {title}" for i, (_, title) in enumerate(self.queue[ctx.guild.id])])
+        player = self.players.get(ctx.guild.id)
+        if player is not None and player.queue:
+            queue_str = "\n".join([f"{i+1}. {title}" for i, (_, title) in enumerate(player.queue)])
             await ctx.send(f"Current queue:\n{queue_str}")
         else:
             await ctx.send("The queue is empty.")
 
     @commands.command(name="remove")
     async def remove(self, ctx, index: int):
-        if ctx.guild.id in self.queue and len(self.queue[ctx.guild.id]) >= index > 0:
-            removed_song = self.queue[ctx.guild.id].pop(index - 1)
+        player = self.players.get(ctx.guild.id)
+        if player is not None and len(player.queue) >= index > 0:
+            removed_song = player.queue[index - 1]
+            del player.queue[index - 1]
+            player.prefetch_upcoming()
             await ctx.send(f"Removed from queue: {removed_song[1]}")
         else:
             await ctx.send("Invalid index or empty queue.")
 
+    @commands.command(name="musicstats")
+    async def music_stats(self, ctx):
+        """Show music player and yt-dlp cache statistics (bot owner only)."""
+        if ctx.author.id != self.user_id:
+            await ctx.send("❌ You do not have permission to use this command.")
+            return
+        states = {}
+        for player in self.players.values():
+            states[player.state] = states.get(player.state, 0) + 1
+        state_text = ", ".join(f"{count} {state}" for state, count in sorted(states.items())) or "none"
+        await ctx.send(
+            f"**Music statistics:**\n"
+            f"Players: {state_text}\n"
+            f"yt-dlp cache: {self.extraction_cache.stats()}\n"
+            f"Playback: {self.opus_streams} tracks passed through as Opus, {self.pcm_streams} transcoded from PCM"
+        )
+
 def setup(bot):
     bot.add_cog(MusicPlayer(bot))
\ No newline at end of file
@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class DailyScheduler:
+    """Run a callback at a fixed "HH:MM" every day for each registered key.
+
+    Entries live in a heap ordered by their next fire timestamp, so each wake-up
+    only touches the entries that are due, and the runner sleeps until the
+    earliest one instead of polling. A fire that is reached late (busy event
+    loop, restart) still runs if it is within the grace window.
+    """
+
+    def __init__(self, tz, callback, grace=timedelta(minutes=15)):
+        self.tz = tz
+        self.callback = callback
+        self.grace = grace
+        self.heap = []
+        self.entries = {}
+        # One increasing counter for every key, so a re-added key never reuses the version of a stale heap entry.
+        self.versions = itertools.count(1)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def next_fire(self, time_str, not_before):
+        """First occurrence of time_str at or after not_before, as an aware datetime."""
+        target = datetime.strptime(time_str, "%H:%M").time()
+        day = not_before.astimezone(self.tz).date()
+        while True:
+            fire_at = self.tz.localize(datetime.combine(day, target))
+            if fire_at >= not_before:
+                return fire_at
+            day += timedelta(days=1)
+
+    def schedule(self, key, time_str, catch_up=False):
+        """Add or replace the entry for key; with catch_up, a fire missed within the grace window is still due."""
+        now = datetime.now(self.tz)
+        not_before = now - self.grace if catch_up else now
+        self._push(key, time_str, self.next_fire(time_str, not_before))
+
+    def unschedule(self, key):
+        # Heap entries are invalidated lazily: anything whose version no longer matches is dropped when popped.
+        self.entries.pop(key, None)
+
+    def _push(self, key, time_str, fire_at):
+        version = next(self.versions)
+        self.entries[key] = (time_str, version)
+        heapq.heappush(self.heap, (fire_at.timestamp(), version, key, fire_at))
+        self.wakeup.set()
+
+    def pop_due(self):
+        """Remove and return (key, fire_at) for every entry due now, rescheduling each for its next day."""
+        now = datetime.now(self.tz)
+        due = []
+        while self.heap and self.heap[0][0] <= now.timestamp():
+            _, version, key, fire_at = heapq.heappop(self.heap)
+            entry = self.entries.get(key)
+            if entry is None or entry[1] != version:
+                continue
+            if now - fire_at <= self.grace:
+                due.append((key, fire_at))
+            else:
+                logger.warning(f"Skipped scheduled run for {key} at {fire_at}, it is past the grace window")
+            self._push(key, entry[0], self.next_fire(entry[0], fire_at + timedelta(minutes=1)))
+        return due
+
+    async def run(self):
+        while True:
+            due = self.pop_due()
+            if due:
+                asyncio.ensure_future(self._fire(due))
+
+            self.wakeup.clear()
+            timeout = max(0.0, self.heap[0][0] - datetime.now(self.tz).timestamp()) if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, due):
+        try:
+            await self.callback(due)
+        except Exception as e:
+            logger.error(f"Scheduled callback failed: {e}")
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
@@ -1,15 +1,20 @@
 import nextcord
 from nextcord.ext import commands, tasks
-import requests
 from datetime import datetime, time
 import os
 from dotenv import load_dotenv
+from http_client import get_http_client
+from broadcast import get_broadcaster
+from message_render import RenderCache, split_message, with_prefix
 
 load_dotenv()
 
 class SteamNotifier(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.http_client = get_http_client(bot)
+        self.broadcaster = get_broadcaster(bot)
+        self.render_cache = RenderCache()
         self.steam_channel_id = None
         self.steam_price_limit = None
         self.scheduled_time = None
@@ -25,10 +30,10 @@ class SteamNotifier(commands.Cog):
         """Search for a game on Steam by name and optional price."""
         if len(args) == 1 and args[0].isdigit():
             max_price = int(args[0])
-            games = self.search_steam_games(max_price=max_price)
+            games = await self.search_steam_games(max_price=max_price)
         else:
             game_name = " ".join(args)
-            games = self.search_steam_games(game_name=game_name)
+            games = await self.search_steam_games(game_name=game_name)
         
         if games:
             message = "**Search Results on Steam:**\n"
@@ -38,7 +43,8 @@ class SteamNotifier(commands.Cog):
                     f"💸 Price: {game['price']}\n"
                     f"🔗 [Link to Steam Store]({game['url']})\n\n"
                 )
-            await ctx.send(message)
+            for chunk in split_message(message):
+                await ctx.send(chunk)
         else:
             await ctx.send("❌ No results found for that search.")
 
@@ -99,26 +105,30 @@ class SteamNotifier(commands.Cog):
         """Task loop for automatic notifications."""
         if self.scheduled_time and datetime.now().time().hour == self.scheduled_time.hour and datetime.now().time().minute == self.scheduled_time.minute:
             if self.steam_channel_id and self.steam_price_limit:
-                channel = self.bot.get_channel(self.steam_channel_id)
-                if channel:
-                    games = self.get_discounted_games()
-                    if games:
-                        message = "**Discounted Games on Steam Below Maximum Price:**\n"
-                        for game in games:
-                            message += (
-                                f"🎮 **{game['name']}**\n"
-                                f"💸 Discounted Price: Rp {game['price']:,}\n"
-                                f"🔗 [Link to Steam Store]({game['url']})\n\n"
-                            )
-                        await channel.send(message)
-
-    def search_steam_games(self, game_name=None, max_price=None):
+                games = await self.get_discounted_games()
+                if games:
+                    body = self.render_cache.render(games, self.render_discounted_games)
+                    message = with_prefix("**Discounted Games on Steam Below Maximum Price:**\n", body)
+                    await self.broadcaster.broadcast(
+                        [("steam", self.steam_channel_id, message)], label="Steam discounts"
+                    )
+
+    def render_discounted_games(self, games):
+        return "".join(
+            f"🎮 **{game['name']}**\n"
+            f"💸 Discounted Price: Rp {game['price']:,}\n"
+            f"🔗 [Link to Steam Store]({game['url']})\n\n"
+            for game in games
+        )
+
+    async def search_steam_games(self, game_name=None, max_price=None):
         """Search for games on Steam by name and price (optional)."""
-        url = f"https://store.steampowered.com/api/storesearch/?term={game_name}&cc=ID&l=indonesian"
+        url = "https://store.steampowered.com/api/storesearch/"
+        params = {"term": str(game_name), "cc": "ID", "l": "indonesian"}
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code != 200:
-                print(f"Error: Steam API returned status {response.status_code}")
+            response = await self.http_client.get(url, params=params, timeout=10)
+            if response.status != 200:
+                print(f"Error: Steam API returned status {response.status}")
                 return []
 
             data = response.json()
@@ -151,13 +161,14 @@ class SteamNotifier(commands.Cog):
             print(f"Error when fetching data from Steam API: {e}")
             return []
 
-    def get_discounted_games(self):
+    async def get_discounted_games(self):
         """Get a list of games with discounts below the maximum price."""
-        url = "https://store.steampowered.com/api/featuredcategories/?cc=ID&l=indonesian"
+        url = "https://store.steampowered.com/api/featuredcategories/"
+        params = {"cc": "ID", "l": "indonesian"}
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code != 200:
-                print(f"Error: Steam API returned status {response.status_code}")
+            response = await self.http_client.get(url, params=params, timeout=10)
+            if response.status != 200:
+                print(f"Error: Steam API returned status {response.status}")
                 return []
 
             data = response.json()
@@ -0,0 +1,61 @@
+import asyncio
+
+from chat_queue import ChatBusyError, UserTurnCoalescer
+
+def test_pending_turns_per_user_are_capped():
+    calls = []
+
+    async def handler(user_id, message, on_update):
+        calls.append(message)
+        await asyncio.sleep(0.01)
+        return f"reply to {message}"
+
+    async def main():
+        turns = UserTurnCoalescer(handler, max_pending_per_user=2)
+        results = await asyncio.gather(
+            *(turns.submit(1, f"spam {i}") for i in range(50)),
+            turns.submit(2, "hello"),
+            return_exceptions=True,
+        )
+        return turns, results
+
+    turns, results = asyncio.run(main())
+    busy = [result for result in results if isinstance(result, ChatBusyError)]
+    # One turn in flight plus two waiting; the rest of the burst is turned away, other users are unaffected.
+    assert len(busy) == 47
+    assert sorted(calls) == ["hello", "spam 0", "spam 1", "spam 2"]
+    assert results[-1] == "reply to hello"
+    assert turns.rejected == 47
+
+def test_turns_run_in_order_per_user():
+    order = []
+
+    async def handler(user_id, message, on_update):
+        order.append(message)
+        await asyncio.sleep(0)
+        return message
+
+    async def main():
+        turns = UserTurnCoalescer(handler, max_pending_per_user=5)
+        return await asyncio.gather(*(turns.submit(1, str(i)) for i in range(4)))
+
+    assert asyncio.run(main()) == ["0", "1", "2", "3"]
+    assert order == ["0", "1", "2", "3"]
+
+def test_merged_turns_share_one_completion():
+    calls = []
+
+    async def handler(user_id, message, on_update):
+        calls.append(message)
+        await asyncio.sleep(0.01)
+        return message
+
+    async def main():
+        turns = UserTurnCoalescer(handler, merge=True, max_pending_per_user=5)
+        first = asyncio.ensure_future(turns.submit(1, "a"))
+        await asyncio.sleep(0)
+        rest = await asyncio.gather(turns.submit(1, "b"), turns.submit(1, "c"))
+        return [await first] + rest
+
+    assert asyncio.run(main()) == ["a", None, "b\nc"]
+    assert calls == ["a", "b\nc"]
@@ -0,0 +1,51 @@
+import asyncio
+import sqlite3
+
+from conversation_store import SQLiteConversationStore
+
+def test_failed_flush_keeps_the_batch_for_the_next_one(tmp_path):
+    async def main():
+        store = SQLiteConversationStore(str(tmp_path / "chat.db"), flush_delay=60)
+        write = store._write
+        failures = []
+
+        def failing_write(*args):
+            if not failures:
+                failures.append(True)
+                raise sqlite3.OperationalError("database is locked")
+            return write(*args)
+
+        store._write = failing_write
+        store.append(1, "user", "hello")
+        store.append(1, "assistant", "hi")
+        await store.flush()
+        assert len(store.pending) == 2
+
+        await store.flush()
+        assert store.pending == []
+        await store.close()
+
+        reopened = SQLiteConversationStore(str(tmp_path / "chat.db"))
+        await reopened.load(1)
+        contents = [message.content for message in reopened.history(1)]
+        await reopened.close()
+        return contents
+
+    assert asyncio.run(main()) == ["hello", "hi"]
+
+def test_cold_load_sees_turns_that_are_not_written_yet(tmp_path):
+    async def main():
+        store = SQLiteConversationStore(str(tmp_path / "chat.db"), flush_delay=60, max_users=1)
+
+        def failing_write(*args):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        store._write = failing_write
+        store.append(1, "user", "hello")
+        store.append(2, "user", "evicts user 1 from memory")
+        await store.load(1)
+        contents = [message.content for message in store.history(1)]
+        await store.close()
+        return contents
+
+    assert asyncio.run(main()) == ["hello"]
@@ -0,0 +1,33 @@
+from conversation_store import Conversation
+from language_detect import LanguageClassifier, UserLanguageTracker
+
+def make_tracker():
+    return UserLanguageTracker(LanguageClassifier())
+
+def test_short_opposite_language_message_does_not_flip():
+    tracker = make_tracker()
+    conversation = Conversation(20, "id")
+
+    assert tracker.update(conversation, "thank you") == "id"
+    assert conversation.language == "id"
+
+def test_two_short_messages_in_a_row_flip():
+    tracker = make_tracker()
+    conversation = Conversation(20, "id")
+
+    tracker.update(conversation, "thank you")
+    assert tracker.update(conversation, "thanks for that") == "en"
+
+def test_interrupted_streak_does_not_flip():
+    tracker = make_tracker()
+    conversation = Conversation(20, "id")
+
+    tracker.update(conversation, "thank you")
+    tracker.update(conversation, "aku lagi sedih banget nih")
+    assert tracker.update(conversation, "thank you") == "id"
+
+def test_long_confident_message_flips_immediately():
+    tracker = make_tracker()
+    conversation = Conversation(20, "id")
+
+    assert tracker.update(conversation, "I think you should tell me what you want to do") == "en"
@@ -0,0 +1,51 @@
+import asyncio
+
+from message_render import StreamingReply
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content):
+        self.content = content
+
+    async def delete(self):
+        self.channel.remove(self)
+
+class FakeContext:
+    def __init__(self):
+        self.channel = []
+
+    async def reply(self, content):
+        return await self.send(content)
+
+    async def send(self, content):
+        message = FakeMessage(self.channel, content)
+        self.channel.append(message)
+        return message
+
+def test_finish_with_shorter_text_removes_stale_follow_ups():
+    async def main():
+        ctx = FakeContext()
+        reply = StreamingReply(ctx, edit_interval=0, limit=20)
+        await reply.update("first part of text " * 3)
+        assert len(ctx.channel) > 1
+        await reply.finish("Oops, try again.")
+        return [message.content for message in ctx.channel], reply
+
+    contents, reply = asyncio.run(main())
+    assert contents == ["Oops, try again."]
+    assert len(reply.messages) == len(reply.contents) == 1
+
+def test_streamed_reply_spills_into_follow_ups():
+    async def main():
+        ctx = FakeContext()
+        reply = StreamingReply(ctx, edit_interval=0, limit=20)
+        await reply.update("short")
+        await reply.finish("short and then a much longer ending")
+        return [message.content for message in ctx.channel]
+
+    contents = asyncio.run(main())
+    assert len(contents) == 2
+    assert " ".join(contents).split() == "short and then a much longer ending".split()
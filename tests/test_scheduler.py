@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import pytz
+
+import scheduler
+from scheduler import DailyScheduler
+
+TZ = pytz.timezone("Asia/Jakarta")
+
+def freeze(monkeypatch, hour, minute, second=0):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return TZ.localize(datetime(2024, 1, 1, hour, minute, second)).astimezone(tz)
+    monkeypatch.setattr(scheduler, "datetime", FrozenDatetime)
+
+async def noop(due):
+    pass
+
+def test_reschedule_after_unschedule_drops_old_time(monkeypatch):
+    freeze(monkeypatch, 6, 0)
+    daily = DailyScheduler(TZ, noop)
+    daily.schedule(1, "07:00")
+    daily.unschedule(1)
+    daily.schedule(1, "09:00")
+
+    freeze(monkeypatch, 7, 0, 30)
+    assert daily.pop_due() == []
+
+    freeze(monkeypatch, 9, 0, 30)
+    assert [key for key, _ in daily.pop_due()] == [1]
+
+def test_replacing_a_schedule_drops_old_time(monkeypatch):
+    freeze(monkeypatch, 6, 0)
+    daily = DailyScheduler(TZ, noop)
+    daily.schedule(1, "07:00")
+    daily.schedule(1, "09:00")
+
+    freeze(monkeypatch, 7, 0, 30)
+    assert daily.pop_due() == []
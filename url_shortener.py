@@ -1,7 +1,7 @@
-import requests
 from nextcord.ext import commands
 from dotenv import load_dotenv
 import os
+from http_client import get_http_client
 
 load_dotenv()
 
@@ -9,16 +9,17 @@ class URLShortener(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.http_client = get_http_client(bot)
         self.api_key = os.getenv("CUTTLY_API_KEY")
         self.base_url = "https://cutt.ly/api/api.php"
 
-    def shorten_link(self, full_link):
+    async def shorten_link(self, full_link):
         """Shorten URL using the Cutt.ly API."""
         if not self.api_key:
             return "Error: Cutt.ly API key not found. Ensure it is set in the .env file."
 
         payload = {"key": self.api_key, "short": full_link}
-        response = requests.get(self.base_url, params=payload)
+        response = await self.http_client.get(self.base_url, params=payload, timeout=10)
         data = response.json()
 
         try:
@@ -32,7 +33,7 @@ class URLShortener(commands.Cog):
     @commands.command(name="short")
     async def shorten_command(self, ctx, link: str):
         """Command to shorten a URL."""
-        result = self.shorten_link(link)
+        result = await self.shorten_link(link)
         await ctx.send(result)
 
 def setup(bot):
@@ -1,58 +1,164 @@
 import nextcord
-from nextcord.ext import commands, tasks
-import requests
+from nextcord.ext import commands
 from datetime import datetime, timedelta
 import pytz
 import json
 import logging
+import asyncio
+import time
+from collections import OrderedDict
+from http_client import get_http_client
+from broadcast import get_broadcaster
+from config_store import ConfigStore, write_json_atomic
+from message_render import RenderCache
+from scheduler import DailyScheduler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 TIMEZONE = pytz.timezone("Asia/Jakarta")
 
+GEOCODE_CACHE_FILE = 'geocode_cache.json'
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+FORECAST_PARAMS = {
+    "daily": "weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max",
+    "current_weather": "true",
+    "timezone": "auto",
+}
+FORECAST_TTL = 600
+FORECAST_BATCH_SIZE = 50
+
+class GeocodingCache:
+    """LRU cache of city name -> coordinates, with negative entries for unknown cities, persisted to disk."""
+
+    def __init__(self, filename=GEOCODE_CACHE_FILE, max_entries=1000, ttl=30 * 24 * 3600, negative_ttl=3600, delay=2.0):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.delay = delay
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._save_handle = None
+        self._write_lock = asyncio.Lock()
+
+    @staticmethod
+    def normalize(city):
+        return " ".join(city.casefold().split())
+
+    def get(self, city):
+        """Return (hit, location); location is None for a cached unknown city."""
+        key = self.normalize(city)
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        if entry["expires"] < time.time():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, entry["location"]
+
+    def set(self, city, location):
+        ttl = self.ttl if location else self.negative_ttl
+        key = self.normalize(city)
+        self.entries[key] = {"location": location, "expires": time.time() + ttl}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        now = time.time()
+        for key, entry in data.items():
+            if entry.get("expires", 0) > now:
+                self.entries[key] = entry
+
+    def schedule_save(self):
+        """Write the cache after the debounce delay, so a burst of lookups costs one write."""
+        if self._save_handle is None:
+            loop = asyncio.get_running_loop()
+            self._save_handle = loop.call_later(self.delay, lambda: asyncio.ensure_future(self.save()))
+
+    async def save(self):
+        """Snapshot on the event loop, then write the file off-loop via temp file + rename, one write at a time."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if not self.dirty:
+            return
+        self.dirty = False
+        payload = json.dumps(self.entries)
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(write_json_atomic, self.filename, payload)
+            except Exception as e:
+                self.dirty = True
+                logger.error(f"Error saving geocoding cache: {e}")
+
 class Weather(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.weather_config = {}
+        self.http_client = get_http_client(bot)
+        self.broadcaster = get_broadcaster(bot)
+        self.render_cache = RenderCache()
+        self.geocoding_cache = GeocodingCache()
+        self.geocoding_cache.load()
+        self.forecast_cache = {}
+        self.forecast_inflight = {}
         self.load_config()
-        self.weather_check.start()
+        self.scheduler = DailyScheduler(TIMEZONE, self.send_scheduled_forecasts)
+        self.bot.loop.create_task(self.start_scheduler())
+
+    async def shutdown(self):
+        await self.geocoding_cache.save()
+
+    def cog_unload(self):
+        self.scheduler.stop()
+        asyncio.ensure_future(self.weather_config.flush())
+        asyncio.ensure_future(self.geocoding_cache.save())
         
     def load_config(self):
-        try:
-            with open('weather_config.json', 'r') as f:
-                self.weather_config = json.load(f)
-                logger.info("Weather configuration successfully loaded")
-        except FileNotFoundError:
-            logger.info("Configuration file not found, creating a new one")
-            self.save_config()
+        self.weather_config = ConfigStore('weather_config.json', key_type=int)
+        logger.info(f"Weather configuration loaded for {len(self.weather_config)} servers")
 
     def save_config(self):
-        with open('weather_config.json', 'w') as f:
-            json.dump(self.weather_config, f, indent=4)
-            logger.info("Weather configuration successfully saved")
+        self.weather_config.save()
 
     async def get_coordinates(self, city):
         """Get coordinates from a city name"""
+        hit, location = self.geocoding_cache.get(city)
+        if hit:
+            return location
+
         try:
-            geocoding_url = f"https://geocoding-api.open-meteo.com/v1/search?name={city}&count=1&language=en"
-            response = requests.get(geocoding_url)
+            geocoding_url = "https://geocoding-api.open-meteo.com/v1/search"
+            params = {"name": city, "count": 1, "language": "en"}
+            response = await self.http_client.get(geocoding_url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
-            if not data.get('results'):
-                return None
-                
-            location = data['results'][0]
-            return {
-                'lat': location['latitude'],
-                'lon': location['longitude'],
-                'name': location['name']
-            }
+            location = None
+            if data.get('results'):
+                result = data['results'][0]
+                location = {
+                    'lat': result['latitude'],
+                    'lon': result['longitude'],
+                    'name': result['name']
+                }
+
         except Exception as e:
             logger.error(f"Error during geocoding: {e}")
             return None
 
+        self.geocoding_cache.set(city, location)
+        self.geocoding_cache.schedule_save()
+        return location
+
     def get_weather_description(self, code):
         """Convert weather code to English description"""
         weather_codes = {
@@ -73,82 +179,202 @@ class Weather(commands.Cog):
         }
         return weather_codes.get(code, "Unknown")
 
-    async def get_weather(self, city):
+    async def get_weather(self, city, location=None):
         try:
-            location = await self.get_coordinates(city)
+            location = location or await self.get_coordinates(city)
             if not location:
                 return "❌ City not found"
 
-            weather_url = (
-                f"https://api.open-meteo.com/v1/forecast"
-                f"?latitude={location['lat']}"
-                f"&longitude={location['lon']}"
-                f"&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max"
-                f"&current_weather=true"
-                f"&timezone=auto"
-            )
-            
-            response = requests.get(weather_url)
-            response.raise_for_status()
-            weather_data = response.json()
-            
-            current = weather_data['current_weather']
-            daily = weather_data['daily']
-            
-            weather_message = (
-                f"🌦️ **Weather Forecast for {location['name']}** 🌦️\n"
-                f"*{datetime.now(TIMEZONE).strftime('%d %B %Y')}*\n\n"
-                f"**Current Conditions:**\n"
-                f"• Temperature: {current['temperature']}°C\n"
-                f"• Wind Speed: {current['windspeed']} km/h\n\n"
-                f"**Today's Forecast:**\n"
-                f"• Conditions: {self.get_weather_description(daily['weather_code'][0])}\n"
-                f"• High: {daily['temperature_2m_max'][0]}°C\n"
-                f"• Low: {daily['temperature_2m_min'][0]}°C\n"
-                f"• Rain Probability: {daily['precipitation_probability_max'][0]}%\n\n"
-                f"**Weather Tips:**\n"
-            )
-            
-            weather_code = daily['weather_code'][0]
-            rain_prob = daily['precipitation_probability_max'][0]
-            
-            if rain_prob > 70:
-                weather_message += "🌂 Don't forget to bring an umbrella! High chance of rain today.\n"
-            elif rain_prob > 30:
-                weather_message += "🌂 There's a chance of rain, better to have an umbrella just in case.\n"
-            
-            if weather_code in [0, 1]:
-                weather_message += "🧴 It's sunny, don't forget to wear sunscreen!\n"
-            elif weather_code in [45, 48]:
-                weather_message += "⚠️ Drive carefully, visibility might be limited.\n"
-            elif weather_code in [95]:
-                weather_message += "⚡ Be cautious of thunderstorms! Avoid outdoor activities.\n"
-            
-            return weather_message
+            weather_data = await self.get_forecast(location)
+            return self.render_weather(location, weather_data)
             
         except Exception as e:
             logger.error(f"Error while fetching weather data: {e}")
             return "❌ Sorry, an error occurred while fetching weather data"
 
-    @tasks.loop(minutes=1)
-    async def weather_check(self):
-        now = datetime.now(TIMEZONE)
-        current_time = now.strftime("%H:%M")
-        
-        for guild_id, config in self.weather_config.items():
-            if config.get("enabled", False) and config.get("time") == current_time:
-                channel = self.bot.get_channel(config["channel_id"])
-                if channel:
-                    weather_report = await self.get_weather(config["city"])
-                    try:
-                        await channel.send(weather_report)
-                        logger.info(f"Successfully sent weather forecast to channel {channel.id}")
-                    except Exception as e:
-                        logger.error(f"Failed to send weather forecast: {e}")
-
-    @weather_check.before_loop
-    async def before_weather_check(self):
+    def forecast_key(self, location):
+        return (round(location['lat'], 4), round(location['lon'], 4))
+
+    async def get_forecast(self, location):
+        """Return the forecast for a location, sharing one in-flight fetch and a short-lived cache between callers."""
+        key = self.forecast_key(location)
+        cached = self.forecast_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        task = self.forecast_inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.fetch_forecast(location))
+            self.track_inflight(key, task)
+        # Shielded so one cancelled caller does not cancel the fetch for everyone else.
+        return await asyncio.shield(task)
+
+    def track_inflight(self, key, future):
+        self.forecast_inflight[key] = future
+
+        def untrack(_):
+            if self.forecast_inflight.get(key) is future:
+                del self.forecast_inflight[key]
+
+        future.add_done_callback(untrack)
+
+    async def prefetch_forecasts(self, locations):
+        """Warm the forecast cache for many locations with as few multi-location requests as possible."""
+        now = time.monotonic()
+        pending = []
+        missing = {}
+        for location in locations:
+            key = self.forecast_key(location)
+            cached = self.forecast_cache.get(key)
+            if cached and cached[0] > now:
+                continue
+            if key in self.forecast_inflight:
+                pending.append(self.forecast_inflight[key])
+            else:
+                missing.setdefault(key, location)
+
+        loop = asyncio.get_running_loop()
+        keys = list(missing)
+        for i in range(0, len(keys), FORECAST_BATCH_SIZE):
+            futures = {}
+            for key in keys[i:i + FORECAST_BATCH_SIZE]:
+                futures[key] = loop.create_future()
+                self.track_inflight(key, futures[key])
+            pending.extend(futures.values())
+            asyncio.ensure_future(self.fetch_forecast_batch([missing[key] for key in futures], futures))
+
+        await asyncio.gather(*(asyncio.shield(future) for future in pending), return_exceptions=True)
+
+    async def fetch_forecast_batch(self, locations, futures):
+        """Fetch several locations in one Open-Meteo call, which returns a list for comma-separated coordinates."""
+        try:
+            params = {
+                "latitude": ",".join(str(location['lat']) for location in locations),
+                "longitude": ",".join(str(location['lon']) for location in locations),
+                **FORECAST_PARAMS,
+            }
+            response = await self.http_client.get(FORECAST_URL, params=params, timeout=20)
+            response.raise_for_status()
+            results = response.json()
+            if isinstance(results, dict):
+                results = [results]
+
+            for location, weather_data in zip(locations, results):
+                self.cache_forecast(location, weather_data)
+                futures[self.forecast_key(location)].set_result(weather_data)
+            logger.info(f"Fetched {len(locations)} forecasts in one request")
+        except Exception as e:
+            logger.error(f"Error while fetching forecasts in bulk: {e}")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(LookupError("Location missing from bulk forecast response"))
+
+    async def fetch_forecast(self, location):
+        params = {"latitude": location['lat'], "longitude": location['lon'], **FORECAST_PARAMS}
+        response = await self.http_client.get(FORECAST_URL, params=params, timeout=10)
+        response.raise_for_status()
+        weather_data = response.json()
+        self.cache_forecast(location, weather_data)
+        return weather_data
+
+    def cache_forecast(self, location, weather_data):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self.forecast_cache.items() if expires <= now]:
+            del self.forecast_cache[key]
+        self.forecast_cache[self.forecast_key(location)] = (now + FORECAST_TTL, weather_data)
+
+    def render_weather(self, location, weather_data):
+        """Render a forecast once per distinct location, day and data set."""
+        daily = weather_data['daily']
+        content = {
+            "name": location['name'],
+            "date": datetime.now(TIMEZONE).strftime('%d %B %Y'),
+            "current": weather_data['current_weather'],
+            "daily": {key: values[0] for key, values in daily.items() if isinstance(values, list)},
+        }
+        return self.render_cache.render_text(content, self.format_weather)
+
+    def format_weather(self, content):
+        current = content['current']
+        daily = content['daily']
+
+        weather_message = (
+            f"🌦️ **Weather Forecast for {content['name']}** 🌦️\n"
+            f"*{content['date']}*\n\n"
+            f"**Current Conditions:**\n"
+            f"• Temperature: {current['temperature']}°C\n"
+            f"• Wind Speed: {current['windspeed']} km/h\n\n"
+            f"**Today's Forecast:**\n"
+            f"• Conditions: {self.get_weather_description(daily['weather_code'])}\n"
+            f"• High: {daily['temperature_2m_max']}°C\n"
+            f"• Low: {daily['temperature_2m_min']}°C\n"
+            f"• Rain Probability: {daily['precipitation_probability_max']}%\n\n"
+            f"**Weather Tips:**\n"
+        )
+
+        weather_code = daily['weather_code']
+        rain_prob = daily['precipitation_probability_max']
+
+        if rain_prob > 70:
+            weather_message += "🌂 Don't forget to bring an umbrella! High chance of rain today.\n"
+        elif rain_prob > 30:
+            weather_message += "🌂 There's a chance of rain, better to have an umbrella just in case.\n"
+
+        if weather_code in [0, 1]:
+            weather_message += "🧴 It's sunny, don't forget to wear sunscreen!\n"
+        elif weather_code in [45, 48]:
+            weather_message += "⚠️ Drive carefully, visibility might be limited.\n"
+        elif weather_code in [95]:
+            weather_message += "⚡ Be cautious of thunderstorms! Avoid outdoor activities.\n"
+
+        return weather_message
+
+    async def start_scheduler(self):
         await self.bot.wait_until_ready()
+        for guild_id, config in self.weather_config.items():
+            if config.get("enabled", False):
+                self.scheduler.schedule(guild_id, config["time"], catch_up=True)
+        self.scheduler.start()
+
+    async def send_scheduled_forecasts(self, due):
+        """Send the forecasts for every guild whose scheduled time has come, once per day each."""
+        due = [
+            (guild_id, self.weather_config[guild_id], fire_at.strftime("%Y-%m-%d"))
+            for guild_id, fire_at in due
+            if guild_id in self.weather_config
+        ]
+        due = [
+            (guild_id, config, date) for guild_id, config, date in due
+            if config.get("enabled", False) and config.get("last_sent") != date
+        ]
+        if not due:
+            return
+
+        cities = {}
+        for _, config, _ in due:
+            cities.setdefault(GeocodingCache.normalize(config["city"]), config["city"])
+        locations = await asyncio.gather(*(self.get_coordinates(city) for city in cities.values()))
+        await self.prefetch_forecasts([location for location in locations if location])
+        reports = await asyncio.gather(*(
+            self.get_weather(city, location) for city, location in zip(cities.values(), locations)
+        ))
+        reports = dict(zip(cities, reports))
+
+        targets = [
+            (guild_id, config["channel_id"], reports[GeocodingCache.normalize(config["city"])])
+            for guild_id, config, _ in due
+        ]
+        result = await self.broadcaster.broadcast(targets, label="Weather forecast")
+
+        sent = set(result.sent)
+        for guild_id, config, date in due:
+            if guild_id in sent:
+                config["last_sent"] = date
+        self.save_config()
 
     @commands.command(name="setw")
     async def set_weather(self, ctx, channel: nextcord.TextChannel, city: str, time: str):
@@ -164,7 +390,7 @@ class Weather(commands.Cog):
                 await ctx.send("❌ City not found!")
                 return
                 
-            self.weather_config[str(ctx.guild.id)] = {
+            self.weather_config[ctx.guild.id] = {
                 "channel_id": channel.id,
                 "city": city,
                 "time": time,
@@ -172,8 +398,9 @@ class Weather(commands.Cog):
             }
             
             self.save_config()
+            self.scheduler.schedule(ctx.guild.id, time)
             
-            weather_report = await self.get_weather(city)
+            weather_report = await self.get_weather(city, location)
             await ctx.send(f"✅ Successfully set up the weather forecast!\n"
                          f"📍 City: {location['name']}\n"
                          f"⏰ Time: {time}\n"
@@ -189,10 +416,11 @@ class Weather(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def stop_weather(self, ctx):
         """Stop daily weather forecasts"""
-        guild_id = str(ctx.guild.id)
+        guild_id = ctx.guild.id
         if guild_id in self.weather_config:
             self.weather_config[guild_id]["enabled"] = False
             self.save_config()
+            self.scheduler.unschedule(guild_id)
             await ctx.send("✅ Daily weather forecasts have been disabled")
         else:
             await ctx.send("❌ Weather forecasts are not set up for this server")
@@ -201,10 +429,11 @@ class Weather(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def start_weather(self, ctx):
         """Resume daily weather forecasts"""
-        guild_id = str(ctx.guild.id)
+        guild_id = ctx.guild.id
         if guild_id in self.weather_config:
             self.weather_config[guild_id]["enabled"] = True
             self.save_config()
+            self.scheduler.schedule(guild_id, self.weather_config[guild_id]["time"])
             await ctx.send("✅ Daily weather forecasts have been enabled")
         else:
             await ctx.send("❌ Weather forecasts are not set up for this server")
@@ -213,7 +442,7 @@ class Weather(commands.Cog):
     async def check_weather(self, ctx, *, city: str = None):
         """Check the current weather for a specific city"""
         if not city:
-            guild_id = str(ctx.guild.id)
+            guild_id = ctx.guild.id
             if guild_id in self.weather_config:
                 city = self.weather_config[guild_id]["city"]
             else:
@@ -0,0 +1,100 @@
+import re
+import time
+from collections import OrderedDict
+
+EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+VIDEO_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})")
+DEFAULT_STREAM_TTL = 3600
+
+# Everything playback needs from a yt-dlp info dict; the rest (formats, thumbnails, ...) is dropped.
+STREAM_FIELDS = ("id", "title", "webpage_url", "url", "ext", "acodec", "abr", "duration", "http_headers")
+
+def stream_expiry(stream_url):
+    """Unix time a resolved stream URL stops working, from the expire parameter googlevideo URLs carry."""
+    match = EXPIRE_RE.search(stream_url)
+    return int(match.group(1)) if match else time.time() + DEFAULT_STREAM_TTL
+
+def video_key(url):
+    """Cache key for a video URL: the YouTube video id when there is one, else the URL itself."""
+    match = VIDEO_ID_RE.search(url)
+    return match.group(1) if match else url
+
+class ExtractionCache:
+    """LRU caches for yt-dlp lookups shared by every guild.
+
+    Search queries map to a video id and title, and video ids map to the
+    stream info needed for playback. Stream info is kept until shortly before
+    the expiry embedded in its URL, so a cached entry is always playable.
+    """
+
+    def __init__(self, max_searches=1000, max_videos=300, search_ttl=24 * 3600, expiry_margin=300):
+        self.max_searches = max_searches
+        self.max_videos = max_videos
+        self.search_ttl = search_ttl
+        self.expiry_margin = expiry_margin
+        self.searches = OrderedDict()
+        self.videos = OrderedDict()
+        self.search_hits = 0
+        self.search_misses = 0
+        self.video_hits = 0
+        self.video_misses = 0
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.casefold().split())
+
+    def get_search(self, query):
+        """Return (video_url, title) for a search query, or None."""
+        key = self.normalize(query)
+        entry = self.searches.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self.searches[key]
+            self.search_misses += 1
+            return None
+        self.searches.move_to_end(key)
+        self.search_hits += 1
+        return entry[1], entry[2]
+
+    def set_search(self, query, info):
+        key = self.normalize(query)
+        self.searches[key] = (time.time() + self.search_ttl, info["webpage_url"], info["title"])
+        self.searches.move_to_end(key)
+        while len(self.searches) > self.max_searches:
+            self.searches.popitem(last=False)
+
+    def is_fresh(self, info):
+        return stream_expiry(info["url"]) - time.time() > self.expiry_margin
+
+    def get_video(self, url):
+        """Return cached stream info for a video URL if it is not about to expire, else None."""
+        key = video_key(url)
+        info = self.videos.get(key)
+        if info is None or not self.is_fresh(info):
+            if info is not None:
+                del self.videos[key]
+            self.video_misses += 1
+            return None
+        self.videos.move_to_end(key)
+        self.video_hits += 1
+        return info
+
+    def set_video(self, url, info):
+        """Store the playback fields of an extracted info dict and return them."""
+        info = {field: info[field] for field in STREAM_FIELDS if field in info}
+        for key in {video_key(url), video_key(info.get("webpage_url", url))}:
+            self.videos[key] = info
+            self.videos.move_to_end(key)
+        while len(self.videos) > self.max_videos:
+            self.videos.popitem(last=False)
+        return info
+
+    def stats(self):
+        def ratio(hits, misses):
+            return hits / (hits + misses) if hits + misses else 0.0
+        return (
+            f"searches {len(self.searches)}/{self.max_searches} cached, "
+            f"{self.search_hits} hits / {self.search_misses} misses ({ratio(self.search_hits, self.search_misses):.0%}); "
+            f"streams {len(self.videos)}/{self.max_videos} cached, "
+            f"{self.video_hits} hits / {self.video_misses} misses ({ratio(self.video_hits, self.video_misses):.0%})"
+        )